@@ -0,0 +1,74 @@
+# agregados.py
+# Tabela de agregados mensais das operações: uma linha por mês × corretora ×
+# tipo de mercado × ativo, com volume e número de negócios de compra e venda e
+# taxas. É mantida na ingestão (ver 'database.salvar_em_banco') para que as telas
+# de resumo leiam poucas centenas de linhas em vez de todas as operações.
+#
+# Reconstrução completa a partir das operações gravadas:
+#   python agregados.py
+
+import hashlib
+
+import pandas as pd
+
+COLECAO_AGREGADOS = "agregados_mensais"
+CHAVES_AGREGADO = ['Ano-Mês', 'Corretora', 'Tipo Mercado', 'Ativo']
+METRICAS_AGREGADO = ['Volume Compra', 'Volume Venda', 'Negócios Compra', 'Negócios Venda', 'Taxas']
+
+
+def calcular_agregados_mensais(df_operacoes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega as operações por mês, corretora, tipo de mercado e ativo.
+    Compra/venda segue a mesma regra do cálculo de posição: 'CompraVenda' quando
+    preenchida, senão 'D/C' (D = compra, C = venda).
+    """
+    if df_operacoes.empty:
+        return pd.DataFrame(columns=CHAVES_AGREGADO + METRICAS_AGREGADO)
+
+    df = df_operacoes
+    datas = df['Data Pregao']
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas = pd.to_datetime(datas, format='%d/%m/%Y', errors='coerce')
+    if 'CompraVenda' in df.columns and not df['CompraVenda'].isnull().all():
+        operacao = df['CompraVenda']
+    else:
+        operacao = df['D/C'].map({'D': 'C', 'C': 'V'})
+    valor = pd.to_numeric(df['Valor'], errors='coerce').fillna(0.0)
+    compra = operacao == 'C'
+    venda = operacao == 'V'
+
+    base = pd.DataFrame({
+        'Ano-Mês': datas.dt.strftime('%Y-%m'),
+        'Corretora': df.get('Corretora', pd.Series('', index=df.index)).fillna(''),
+        'Tipo Mercado': df.get('Tipo Mercado', pd.Series('', index=df.index)).fillna(''),
+        'Ativo': (df['Ativo'] if 'Ativo' in df.columns else df['Titulo']).fillna(''),
+        'Volume Compra': valor.where(compra, 0.0),
+        'Volume Venda': valor.where(venda, 0.0),
+        'Negócios Compra': compra.astype(int),
+        'Negócios Venda': venda.astype(int),
+        'Taxas': pd.to_numeric(df['Taxas'], errors='coerce').fillna(0.0) if 'Taxas' in df.columns else 0.0,
+    })
+    base = base.dropna(subset=['Ano-Mês'])
+    return base.groupby(CHAVES_AGREGADO, as_index=False)[METRICAS_AGREGADO].sum()
+
+
+def valor_por_tipo_mercado(df_agregados: pd.DataFrame) -> pd.DataFrame:
+    """Volume total (compras + vendas) por tipo de mercado, a partir dos agregados."""
+    if df_agregados.empty:
+        return pd.DataFrame(columns=['Tipo Mercado', 'Valor'])
+    valor = df_agregados['Volume Compra'].fillna(0) + df_agregados['Volume Venda'].fillna(0)
+    return (valor.groupby(df_agregados['Tipo Mercado']).sum()
+                 .rename('Valor').reset_index())
+
+
+def id_agregado(ano_mes: str, corretora: str, tipo_mercado: str, ativo: str) -> str:
+    """ID determinístico do documento do agregado (os nomes podem conter '/')."""
+    chave = "|".join([ano_mes, corretora, tipo_mercado, ativo])
+    return hashlib.sha1(chave.encode('utf-8')).hexdigest()
+
+
+if __name__ == "__main__":
+    from database import reconstruir_agregados_mensais
+
+    total = reconstruir_agregados_mensais()
+    print(f"Agregados mensais reconstruídos: {total} linha(s).")
@@ -6,25 +6,35 @@ import traceback
 import re
 import locale
 import datetime
-from collections import defaultdict
 
 # --- Imports dos Módulos do Projeto ---
 from parsers.factory import get_parser_for_text
-from utils import carregar_dados_corretoras, separar_notas
-from database import salvar_em_banco, nota_existe, carregar_dados_do_banco
-import ir_calculator
+from utils import carregar_dados_corretoras, separar_notas, converter_data_pregao
+from database import (
+    salvar_em_banco, nota_existe, carregar_dados_do_banco, consultar_colecao,
+    carregar_colecoes, aquecer_conexao, versao_colecao, resultado_em_cache,
+    erro_inicializacao_firebase
+)
+import ir_checkpoints
+import posicoes
+from agregados import COLECAO_AGREGADOS, valor_por_tipo_mercado
+from componentes import tabela_paginada, paginar_dataframe
 import io
 
-# --- Função de Cache para Carregamento de Dados (ESSENCIAL) ---
-@st.cache_data(ttl=3600) # Cache expira a cada 1 hora para buscar novos dados
+# --- Função de Carregamento de Dados (ESSENCIAL) ---
 def load_cached_data(table_name):
     """
-    Função intermediária para carregar dados do banco com cache,
-    evitando chamadas repetidas ao Firebase/banco de dados.
+    Função intermediária para carregar dados do banco. O cache fica na camada de
+    banco ('database.carregar_dados_do_banco'), que mantém cada coleção em memória
+    e busca no Firebase apenas os documentos gravados desde a última leitura.
     """
-    st.info(f"Buscando dados da tabela '{table_name}' no banco... (Esta mensagem deve aparecer raramente)")
     return carregar_dados_do_banco(table_name)
 
+# Coleções exibidas nas abas de Dashboard, IR e Meus Ativos
+COLECOES_PAINEL = [
+    "notas_cabecalho", "operacoes", "resumos_negocios", "resumos_financeiros", COLECAO_AGREGADOS
+]
+
 # --- Configuração de Localidade ---
 try:
     locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
@@ -38,6 +48,9 @@ except locale.Error:
 st.set_page_config(page_title="Gerenciador de Notas de Corretagem", layout="wide")
 st.title("📈 Gerenciador de Notas de Corretagem")
 
+# Começa a carregar os módulos do Firebase enquanto o restante da página é montado
+aquecer_conexao()
+
 # --- Carregamento de Dados Iniciais (cache) ---
 @st.cache_data
 def carregar_corretoras_cached():
@@ -48,6 +61,9 @@ if corretoras_df.empty:
     st.warning("O arquivo 'corretoras_cnpj.csv' não foi encontrado ou está vazio.")
 
 # --- Funções Auxiliares ---
+# 'Data Pregao' chega do banco como datetime; exibida no formato brasileiro
+CONFIG_COLUNA_DATA = {"Data Pregao": st.column_config.DateColumn(format="DD/MM/YYYY")}
+
 CAMPOS_RESUMO_NEGOCIOS = [
     "Debêntures", "Vendas à vista", "Compras à vista", "Opções - compras",
     "Opções - vendas", "Operações à termo", "Valor das oper. c/ títulos públ. (v. nom.)",
@@ -62,6 +78,16 @@ CAMPOS_RESUMO_FINANCEIRO = [
     "Total Corretagem / Despesas", "Líquido para"
 ]
 
+# Colunas de 'operacoes' usadas por cada aba (projeção enviada ao banco)
+COLUNAS_IR = (
+    "Data Pregao", "Titulo", "Titulo Original", "Tipo Mercado", "Vencimento",
+    "CompraVenda", "D/C", "Valor", "Quantidade", "Taxas"
+)
+COLUNAS_POSICAO = (
+    "Data Pregao", "Titulo", "Tipo Mercado", "Vencimento", "CompraVenda",
+    "D/C", "Valor", "Quantidade", "Corretora"
+)
+
 def converter_valor_monetario(valor_str):
     if pd.isna(valor_str):
         return None
@@ -71,6 +97,12 @@ def converter_valor_monetario(valor_str):
         valor_str = valor_str.replace('.', '').replace(',', '.')
     return pd.to_numeric(valor_str, errors='coerce')
 
+def formatar_pagina_operacoes(df_pagina: pd.DataFrame):
+    df_pagina = df_pagina.copy()
+    df_pagina['Preço'] = df_pagina['Preço'].apply(converter_valor_monetario)
+    df_pagina['Valor'] = df_pagina['Valor'].apply(converter_valor_monetario)
+    return df_pagina.style.format({'Preço': "R$ {:,.4f}", 'Valor': "R$ {:,.2f}"})
+
 def extrair_campos_por_nome(texto, campos):
     resultado = {}
     linhas = texto.split('\n')
@@ -93,86 +125,37 @@ def extrair_campos_por_nome(texto, campos):
             resultado[campo] = {"valor": "0,00", "dc": ""}
     return resultado
 
-# --- Função de Cálculo de Posição (colocada aqui por dependência de dados) ---
-@st.cache_data # Adicionando cache aqui também para otimizar
-def calcular_posicao_atual(df_operacoes: pd.DataFrame) -> pd.DataFrame:
-    if df_operacoes.empty:
-        return pd.DataFrame()
-    df = df_operacoes.copy()
-    if 'Ativo' not in df.columns:
-        df.rename(columns={'Titulo': 'Ativo'}, inplace=True)
-    if 'Vencimento' not in df.columns:
-        df['Vencimento'] = ""
-    df['Data Pregao'] = pd.to_datetime(df['Data Pregao'], format='%d/%m/%Y', errors='coerce')
-    if 'CompraVenda' in df.columns and not df['CompraVenda'].isnull().all():
-        df['Operacao'] = df['CompraVenda']
-    else:
-        df['Operacao'] = df['D/C'].map({'D': 'C', 'C': 'V'})
-    df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
-    df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce')
-    df.dropna(subset=['Valor', 'Quantidade', 'Operacao', 'Ativo'], inplace=True)
-
-    posicoes = defaultdict(lambda: {
-        'long': {'qtd': 0, 'custo': 0.0}, 'short': {'qtd': 0, 'receita': 0.0},
-        'last_date': pd.NaT, 'corretora': '', 'tipo_mercado': '', 'vencimento': ''
-    })
-    df = df.sort_values(by='Data Pregao')
-
-    for _, row in df.iterrows():
-        key = row['Ativo']
-        op, qtd, valor, data = row['Operacao'], row['Quantidade'], row['Valor'], row['Data Pregao']
-        if posicoes[key]['corretora'] == '':
-            posicoes[key].update({
-                'corretora': row.get('Corretora', 'N/A'),
-                'tipo_mercado': row.get('Tipo Mercado', 'N/A'),
-                'vencimento': row.get('Vencimento', '')
-            })
-        if op == 'C':
-            if posicoes[key]['short']['qtd'] > 0:
-                qtd_a_fechar = min(qtd, posicoes[key]['short']['qtd'])
-                receita_media = posicoes[key]['short']['receita'] / posicoes[key]['short']['qtd']
-                posicoes[key]['short']['qtd'] -= qtd_a_fechar
-                posicoes[key]['short']['receita'] -= (receita_media * qtd_a_fechar)
-                qtd_restante = qtd - qtd_a_fechar
-                if qtd_restante > 0:
-                    posicoes[key]['long']['qtd'] += qtd_restante
-                    posicoes[key]['long']['custo'] += (valor / qtd) * qtd_restante if qtd > 0 else 0
-            else:
-                posicoes[key]['long']['qtd'] += qtd
-                posicoes[key]['long']['custo'] += valor
-        elif op == 'V':
-            if posicoes[key]['long']['qtd'] > 0:
-                qtd_a_vender = min(qtd, posicoes[key]['long']['qtd'])
-                custo_medio = posicoes[key]['long']['custo'] / posicoes[key]['long']['qtd'] if posicoes[key]['long']['qtd'] > 0 else 0
-                posicoes[key]['long']['qtd'] -= qtd_a_vender
-                posicoes[key]['long']['custo'] -= (custo_medio * qtd_a_vender)
-                qtd_restante = qtd - qtd_a_vender
-                if qtd_restante > 0:
-                    posicoes[key]['short']['qtd'] += qtd_restante
-                    posicoes[key]['short']['receita'] += (valor / qtd) * qtd_restante if qtd > 0 else 0
-            else:
-                posicoes[key]['short']['qtd'] += qtd
-                posicoes[key]['short']['receita'] += valor
-        posicoes[key]['last_date'] = data
-
-    lista_posicao_final = []
-    for ativo, data in posicoes.items():
-        posicao_long = data['long']
-        if posicao_long['qtd'] > 0.0001:
-            preco_medio = posicao_long['custo'] / posicao_long['qtd'] if posicao_long['qtd'] > 0 else 0
-            venc_dt = pd.to_datetime(data['vencimento'], errors='coerce')
-            venc_str = venc_dt.strftime('%d/%m/%Y') if pd.notna(venc_dt) else 'N/A'
-            lista_posicao_final.append({
-                'Corretora': data['corretora'], 'Ativo': ativo, 'Tipo Mercado': data['tipo_mercado'],
-                'Vencimento': venc_str, 'Quantidade Custódia': int(round(posicao_long['qtd'])),
-                'Preço Médio Compra': round(preco_medio, 4), 'Custo Total': round(posicao_long['custo'], 2),
-                'Última Data Pregão': data['last_date'].strftime('%d/%m/%Y')
-            })
-
-    if not lista_posicao_final:
-        return pd.DataFrame()
-    df_posicao = pd.DataFrame(lista_posicao_final)
-    return df_posicao.sort_values(by=['Corretora', 'Ativo', 'Vencimento'])
+# --- Cálculos derivados das coleções ---
+# Guardados em memória pela versão da coleção ('database.versao_colecao'), e não pelo
+# conteúdo dos DataFrames: um rerun sem dados novos não serializa nem copia nada.
+# Os resultados são compartilhados e não devem ser alterados.
+
+def historico_posicoes(versao_operacoes) -> dict:
+    """Operações preparadas e snapshots mensais da posição (ver 'posicoes.gerar_historico')."""
+    return resultado_em_cache(
+        "operacoes", versao_operacoes, "historico_posicoes",
+        lambda: posicoes.gerar_historico(consultar_colecao("operacoes", colunas=COLUNAS_POSICAO))
+    )
+
+def operacoes_ir(versao_operacoes):
+    """(operações com as colunas do IR, data do último pregão ou None)."""
+    def _calcular():
+        df_operacoes = consultar_colecao("operacoes", colunas=COLUNAS_IR)
+        if df_operacoes.empty:
+            return df_operacoes, None
+        datas_pregao = converter_data_pregao(df_operacoes['Data Pregao']).dropna()
+        return df_operacoes, (datas_pregao.max().date() if not datas_pregao.empty else None)
+    return resultado_em_cache("operacoes", versao_operacoes, ("operacoes_ir", COLUNAS_IR), _calcular)
+
+def resumos_agregados(versao_agregados):
+    """(agregados mensais ordenados para exibição, valor por tipo de mercado)."""
+    def _calcular():
+        df_agregados = load_cached_data(COLECAO_AGREGADOS)
+        if df_agregados.empty:
+            return df_agregados, df_agregados
+        ordenados = df_agregados.sort_values(['Ano-Mês', 'Corretora', 'Ativo'], ascending=[False, True, True])
+        return ordenados, valor_por_tipo_mercado(df_agregados)
+    return resultado_em_cache(COLECAO_AGREGADOS, versao_agregados, "resumos", _calcular)
 
 # --- Definição das Abas ---
 tab1, tab2, tab3, tab4 = st.tabs(["📤 Upload PDF", "📊 Dashboard", "💰 Cálculo de IR", "💼 Meus Ativos"])
@@ -199,6 +182,12 @@ with tab1:
             st.error(f"Ocorreu um erro inesperado ao processar o PDF: {e}")
             st.error(traceback.format_exc())
 
+# Busca as coleções em paralelo antes de montar as abas; com a cópia em memória
+# preenchida, as leituras abaixo (inclusive as das abas 3 e 4) não vão à rede.
+carregar_colecoes(COLECOES_PAINEL)
+if erro_inicializacao_firebase() is not None:
+    st.error(f"Falha ao inicializar o Firebase. Verifique seus Secrets: {erro_inicializacao_firebase()}")
+
 with tab2:
     st.header("Dashboard de Acompanhamento")
     
@@ -213,25 +202,55 @@ with tab2:
 
     st.markdown("---")
     st.subheader("Detalhes das Operações")
-    # CORREÇÃO: Usando a função com cache
-    df_operacoes = load_cached_data("operacoes")
+    if st.checkbox("Filtrar operações por período"):
+        hoje = datetime.date.today()
+        periodo = st.date_input(
+            "Período (data do pregão):",
+            value=(hoje - datetime.timedelta(days=90), hoje),
+            format="DD/MM/YYYY"
+        )
+        # Durante a seleção o intervalo pode ter só a data inicial
+        data_inicio, data_fim = (tuple(periodo) + (None,))[:2]
+        df_operacoes = consultar_colecao("operacoes", data_inicio=data_inicio, data_fim=data_fim)
+    else:
+        # CORREÇÃO: Usando a função com cache
+        df_operacoes = load_cached_data("operacoes")
     if not df_operacoes.empty:
-        df_operacoes_formatted = df_operacoes.copy()
-        df_operacoes_formatted['Preço'] = df_operacoes_formatted['Preço'].apply(converter_valor_monetario)
-        df_operacoes_formatted['Valor'] = df_operacoes_formatted['Valor'].apply(converter_valor_monetario)
-        st.dataframe(
-            df_operacoes_formatted.style.format({'Preço': "R$ {:,.4f}", 'Valor': "R$ {:,.2f}"}),
-            use_container_width=True
+        # Paginação: conversão, Styler e envio ao navegador só da página visível
+        tabela_paginada(
+            "app_operacoes",
+            lambda ordem, crescente, filtro, limite, deslocamento: paginar_dataframe(
+                df_operacoes, ordem, crescente, filtro, limite, deslocamento),
+            list(df_operacoes.columns),
+            formatar_pagina=formatar_pagina_operacoes,
+            use_container_width=True, column_config=CONFIG_COLUNA_DATA
         )
     else:
         st.info("Nenhum dado de operações encontrado.")
 
+    st.markdown("---")
+    st.subheader("Resumo Mensal por Ativo")
+    # Lido da tabela de agregados mantida na ingestão, sem percorrer as operações
+    df_agregados, df_valor_por_tipo = resumos_agregados(versao_colecao(COLECAO_AGREGADOS))
+    if not df_agregados.empty:
+        st.dataframe(
+            df_agregados.style.format({'Volume Compra': "R$ {:,.2f}", 'Volume Venda': "R$ {:,.2f}", 'Taxas': "R$ {:,.2f}"}),
+            use_container_width=True, hide_index=True
+        )
+        st.markdown("##### Resumo de Valores por Tipo de Mercado")
+        st.dataframe(
+            df_valor_por_tipo.style.format({'Valor': "R$ {:,.2f}"}),
+            hide_index=True
+        )
+    else:
+        st.info("Nenhum agregado mensal encontrado.")
+
     st.markdown("---")
     st.subheader("Resumo dos Negócios")
     # CORREÇÃO: Usando a função com cache
     df_resumos_negocios = load_cached_data("resumos_negocios")
     if not df_resumos_negocios.empty:
-        st.dataframe(df_resumos_negocios, use_container_width=True)
+        st.dataframe(df_resumos_negocios, use_container_width=True, column_config=CONFIG_COLUNA_DATA)
     else:
         st.info("Nenhum dado de resumo de negócios encontrado.")
 
@@ -240,21 +259,21 @@ with tab2:
     # CORREÇÃO: Usando a função com cache
     df_resumos_financeiros = load_cached_data("resumos_financeiros")
     if not df_resumos_financeiros.empty:
-        st.dataframe(df_resumos_financeiros, use_container_width=True)
+        st.dataframe(df_resumos_financeiros, use_container_width=True, column_config=CONFIG_COLUNA_DATA)
     else:
         st.info("Nenhum dado de resumo financeiro encontrado.")
 
 with tab3:
     st.header("💰 Cálculo de Imposto de Renda (IR)")
-    # CORREÇÃO: Usando a função com cache
-    df_operacoes = load_cached_data("operacoes")
+    # Busca apenas as colunas usadas no cálculo do IR (versão lida antes dos dados)
+    versao_operacoes = versao_colecao("operacoes")
+    df_operacoes, ultimo_pregao = operacoes_ir(versao_operacoes)
 
     if not df_operacoes.empty:
         st.subheader("Selecione a Data de Apuração")
-        df_operacoes['Data Pregao'] = pd.to_datetime(df_operacoes['Data Pregao'], format='%d/%m/%Y', errors='coerce').dropna()
         
         # Lógica de data padrão
-        max_date_in_data = df_operacoes['Data Pregao'].max().date() if not df_operacoes.empty else datetime.date.today()
+        max_date_in_data = ultimo_pregao or datetime.date.today()
         default_date = max(max_date_in_data, datetime.date.today())
 
         data_apuracao = st.date_input(
@@ -265,7 +284,12 @@ with tab3:
         
         # MELHORIA: Adicionando spinner para feedback visual
         with st.spinner("Analisando operações e calculando IR..."):
-            df_ir = ir_calculator.calcular_ir(df_operacoes, data_apuracao=data_apuracao)
+            # Resultado em cache pela versão das operações e mês de apuração; sem
+            # cache, recalcula só a partir do primeiro mês com operações alteradas
+            df_ir = ir_checkpoints.calcular_ir_em_cache(
+                df_operacoes, data_apuracao=data_apuracao, conta="operacoes",
+                versao=versao_operacoes
+            )
 
         if not df_ir.empty:
             st.subheader("📊 Resumo Mensal por Categoria")
@@ -277,16 +301,35 @@ with tab3:
 
 with tab4:
     st.header("💼 Meus Ativos por Corretora")
-    # CORREÇÃO: Usando a função com cache
-    df_operacoes = load_cached_data("operacoes")
+    # Busca apenas as colunas usadas no cálculo da posição (versão lida antes dos dados)
+    versao_operacoes = versao_colecao("operacoes")
+    historico = historico_posicoes(versao_operacoes)
     
-    if not df_operacoes.empty:
+    if not historico['operacoes'].empty:
+        datas_pregao = historico['datas']
+        ultima_data = pd.Timestamp(datas_pregao[-1]).date() if len(datas_pregao) else datetime.date.today()
+        data_posicao = st.date_input(
+            "Posição em:",
+            value=max(ultima_data, datetime.date.today()),
+            format="DD/MM/YYYY",
+            help="Ex.: 31/12 para a declaração de Bens e Direitos"
+        )
+
         # MELHORIA: Adicionando spinner para feedback visual
-        with st.spinner("Calculando posição atual dos ativos..."):
-            df_posicao_atual = calcular_posicao_atual(df_operacoes)
+        with st.spinner("Calculando posição dos ativos..."):
+            if data_posicao >= ultima_data:
+                df_posicao_atual = resultado_em_cache(
+                    "operacoes", versao_operacoes, "posicao_atual", lambda: posicoes.posicao_atual(historico))
+                titulo_posicao = "Custódia Atual por Ativo e Corretora"
+            else:
+                # Parte do snapshot mensal anterior à data e reaplica só as operações seguintes
+                df_posicao_atual = resultado_em_cache(
+                    "operacoes", versao_operacoes, ("posicao_em", data_posicao),
+                    lambda: posicoes.posicao_em(historico, data_posicao))
+                titulo_posicao = f"Custódia em {data_posicao.strftime('%d/%m/%Y')} por Ativo e Corretora"
 
         if not df_posicao_atual.empty:
-            st.subheader("Custódia Atual por Ativo e Corretora")
+            st.subheader(titulo_posicao)
             st.dataframe(
                 df_posicao_atual.style.format({'Preço Médio Compra': "R$ {:,.4f}", 'Custo Total': "R$ {:,.2f}"}),
                 use_container_width=True
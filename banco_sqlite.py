@@ -0,0 +1,180 @@
+# banco_sqlite.py
+# Camada de acesso ao banco SQLite local (notas_corretagem.db), usada pelo dashboard.py.
+# - Uma única conexão por processo e arquivo, compartilhada entre as threads do
+#   Streamlit (o acesso é serializado por um lock).
+# - Modo WAL: leituras não bloqueiam gravações feitas por outros processos.
+# - Migrações pendentes (migracoes.py) aplicadas ao abrir a conexão.
+# - Consultas parametrizadas, reaproveitadas pelo cache de statements do sqlite3.
+# - Cache de leituras invalidado pelo contador de alterações do banco: enquanto
+#   nada mudar, as releituras do dashboard não voltam ao disco.
+
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import migracoes
+
+DB_PATH = "notas_corretagem.db"
+
+_conexoes = {}
+_lock = threading.RLock()
+# Leituras guardadas (as menos usadas saem primeiro); cada página, ordenação e filtro
+# da paginação é uma entrada
+MAX_LEITURAS_EM_CACHE = 64
+# (caminho, consulta, parâmetros) -> (versão do banco, DataFrame)
+_cache_leituras = OrderedDict()
+
+
+def obter_conexao(caminho: str = DB_PATH) -> sqlite3.Connection:
+    """Retorna a conexão do processo para o arquivo, criando-a na primeira chamada."""
+    with _lock:
+        conn = _conexoes.get(caminho)
+        if conn is None:
+            conn = sqlite3.connect(caminho, check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Esquema, coluna CompraVenda e índices vêm das migrações versionadas
+            migracoes.aplicar_migracoes(conn)
+            _conexoes[caminho] = conn
+        return conn
+
+
+def versao_banco(caminho: str = DB_PATH) -> tuple:
+    """
+    Versão atual do banco: muda sempre que algum dado é gravado, seja por esta
+    conexão (total_changes) ou por outra conexão/processo (PRAGMA data_version).
+    """
+    with _lock:
+        conn = obter_conexao(caminho)
+        return conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes
+
+
+def consultar(query: str, params: tuple = (), caminho: str = DB_PATH) -> pd.DataFrame:
+    """
+    Executa uma consulta de leitura e retorna o resultado como DataFrame. O resultado
+    fica em cache (LRU de MAX_LEITURAS_EM_CACHE entradas) até a próxima alteração no
+    banco; é devolvida uma cópia.
+    """
+    chave = (caminho, query, tuple(params))
+    with _lock:
+        versao = versao_banco(caminho)
+        em_cache = _cache_leituras.get(chave)
+        if em_cache is not None and em_cache[0] == versao:
+            _cache_leituras.move_to_end(chave)
+            df = em_cache[1]
+        else:
+            _descartar_versoes_antigas(caminho, versao)
+            df = pd.read_sql_query(query, obter_conexao(caminho), params=list(params))
+            _cache_leituras[chave] = (versao, df)
+            while len(_cache_leituras) > MAX_LEITURAS_EM_CACHE:
+                _cache_leituras.popitem(last=False)
+    return df.copy()
+
+
+def _descartar_versoes_antigas(caminho: str, versao: tuple):
+    """Remove do cache as leituras do arquivo feitas em versões anteriores do banco."""
+    obsoletas = [chave for chave, (v, _) in _cache_leituras.items() if chave[0] == caminho and v != versao]
+    for chave in obsoletas:
+        del _cache_leituras[chave]
+
+
+def ler_tabela(nome_tabela: str, colunas: list = None, filtros: dict = None,
+               caminho: str = DB_PATH) -> pd.DataFrame:
+    """
+    Lê uma tabela. 'colunas' limita as colunas lidas e 'filtros' ({coluna: valor})
+    vira um WHERE com igualdades.
+    """
+    select = ", ".join(f'"{c}"' for c in colunas) if colunas else "*"
+    query = f'SELECT {select} FROM "{nome_tabela}"'
+    params = ()
+    if filtros:
+        query += " WHERE " + " AND ".join(f'"{c}" = ?' for c in filtros)
+        params = tuple(filtros.values())
+    return consultar(query, params, caminho)
+
+
+# --- Agregações ---
+# Executadas no SQLite (GROUP BY), de modo que os resumos do dashboard não precisem
+# carregar as tabelas inteiras. Os resultados, pequenos, usam o mesmo cache de 'consultar'.
+
+def valor_por_tipo_mercado(caminho: str = DB_PATH) -> pd.DataFrame:
+    """
+    Soma de 'Valor' das operações por 'Tipo Mercado'. Valores não numéricos ('7,5',
+    'abc', que a afinidade REAL da coluna deixa como texto) ficam de fora, como no
+    pd.to_numeric(errors='coerce'); CAST os truncaria ('7,5' -> 7.0, 'abc' -> 0.0).
+    """
+    return consultar("""
+        SELECT "Tipo Mercado",
+               SUM(CASE WHEN typeof("Valor") IN ('integer', 'real') THEN "Valor" END) AS "Valor"
+        FROM operacoes
+        WHERE "Tipo Mercado" IS NOT NULL AND "Valor" IS NOT NULL
+        GROUP BY "Tipo Mercado"
+        ORDER BY "Tipo Mercado"
+    """, caminho=caminho)
+
+
+def contagem_notas_por_corretora(corretora: str = None, caminho: str = DB_PATH) -> pd.DataFrame:
+    """Quantidade de notas por corretora, da maior para a menor (opcionalmente de uma só)."""
+    filtro, params = "", ()
+    if corretora is not None:
+        filtro, params = "AND corretora = ?", (corretora,)
+    return consultar(f"""
+        SELECT corretora AS "Corretora", COUNT(*) AS "Quantidade de Notas"
+        FROM notas_cabecalho
+        WHERE corretora IS NOT NULL {filtro}
+        GROUP BY corretora
+        ORDER BY COUNT(*) DESC, corretora
+    """, params, caminho)
+
+
+def corretoras_distintas(caminho: str = DB_PATH) -> list:
+    """Corretoras presentes em 'notas_cabecalho', na ordem da primeira nota."""
+    df = consultar("""
+        SELECT corretora FROM notas_cabecalho
+        WHERE corretora IS NOT NULL
+        GROUP BY corretora
+        ORDER BY MIN(rowid)
+    """, caminho=caminho)
+    return df['corretora'].tolist()
+
+
+# --- Paginação ---
+# Usada pelo componente 'componentes.tabela_paginada': só a página visível é lida.
+
+# Colunas de data gravadas como texto 'dd/mm/aaaa': ordenadas como aaaammdd
+_ORDENACAO_DATA = "substr({c}, 7, 4) || substr({c}, 4, 2) || substr({c}, 1, 2)"
+COLUNAS_DATA = {"Data Pregao", "data_pregao"}
+
+
+def colunas_da_tabela(nome_tabela: str, caminho: str = DB_PATH) -> list:
+    with _lock:
+        cursor = obter_conexao(caminho).execute(f'PRAGMA table_info("{nome_tabela}")')
+        return [linha[1] for linha in cursor]
+
+
+def pagina_tabela(nome_tabela: str, ordenar_por, crescente: bool, filtro: str,
+                  limite: int, deslocamento: int, caminho: str = DB_PATH):
+    """
+    Retorna (DataFrame com até 'limite' linhas a partir de 'deslocamento', total de
+    linhas que atendem ao filtro). O filtro de texto procura em todas as colunas.
+    """
+    colunas = colunas_da_tabela(nome_tabela, caminho)
+    where, params = "", ()
+    if filtro:
+        where = "WHERE " + " OR ".join(f'CAST("{c}" AS TEXT) LIKE ?' for c in colunas)
+        params = tuple(f"%{filtro}%" for _ in colunas)
+
+    ordem = "rowid"
+    if ordenar_por in colunas:
+        coluna = f'"{ordenar_por}"'
+        expressao = _ORDENACAO_DATA.format(c=coluna) if ordenar_por in COLUNAS_DATA else coluna
+        ordem = f"{expressao} {'ASC' if crescente else 'DESC'}, rowid"
+
+    total = consultar(f'SELECT COUNT(*) AS total FROM "{nome_tabela}" {where}', params, caminho)['total'].iloc[0]
+    pagina = consultar(
+        f'SELECT * FROM "{nome_tabela}" {where} ORDER BY {ordem} LIMIT ? OFFSET ?',
+        params + (int(limite), int(deslocamento)), caminho
+    )
+    return pagina, int(total)
@@ -0,0 +1,188 @@
+# benchmarks/calculo_ir.py
+# Mede 'ir_calculator.calcular_ir' etapa por etapa sobre históricos sintéticos,
+# sem acesso ao Firestore. O DataFrame gerado tem o mesmo formato que a aba de IR
+# recebe de 'consultar_colecao("operacoes", colunas=COLUNAS_IR)': 'Data Pregao' já
+# em datetime e os demais campos como gravados pela ingestão das notas.
+#
+#   python benchmarks/calculo_ir.py                         # 1k, 10k, 100k e 1M linhas
+#   python benchmarks/calculo_ir.py --tamanhos 1000 10000 --repeticoes 5
+#
+# O histórico mistura swing trade em ações, day trade, opções (zeradas e que
+# expiram), FIIs e vendas a descoberto, ao longo de dez anos. A mesma semente gera
+# sempre as mesmas operações.
+#
+# Etapas (tempo: mediana das repetições; memória: pico alocado na etapa):
+#   preparacao       datas, vencimentos, sentido C/V, valores e ordenação;
+#   categorizacao    classificação das categorias de apuração;
+#   opcoes           liquidação das séries de opções;
+#   outros_ativos    preço médio das demais operações;
+#   apuracao_mensal  soma mensal, compensação de prejuízos e DARF.
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import ir_calculator  # noqa: E402
+
+TAMANHOS_PADRAO = [1_000, 10_000, 100_000, 1_000_000]
+INICIO_HISTORICO = pd.Timestamp("2015-01-02")
+DIAS_HISTORICO = 10 * 365
+
+# Tipo de negócio -> peso no histórico
+TIPOS_NEGOCIO = {
+    'swing': 0.45,
+    'day_trade': 0.15,
+    'opcao': 0.20,
+    'fii': 0.10,
+    'descoberto': 0.10,
+}
+
+
+def gerar_operacoes(n: int, semente: int = 0) -> pd.DataFrame:
+    """
+    Gera cerca de 'n' operações (pares abertura/fechamento; parte das opções não
+    é fechada e expira) com as colunas de COLUNAS_IR, em ordem aleatória como as
+    devolvidas pelo banco.
+    """
+    rng = np.random.default_rng(semente)
+    pares = max(1, n // 2)
+    tipos = rng.choice(list(TIPOS_NEGOCIO), pares, p=list(TIPOS_NEGOCIO.values()))
+
+    acoes = np.array([f"ACAO{i:03d} ON" for i in range(300)] + ["PETROBRAS PN", "VALE ON", "ITAUUNIBANCO PN"])
+    fiis = np.array([f"FII FUNDO{i:02d} CI ER" for i in range(60)])
+    bases_opcao = np.array(["PETR", "VALE", "BOVA", "ITUB", "BBDC"])
+    letras_compra = np.array(list("ABCDEFGHIJKL"))
+
+    abertura = INICIO_HISTORICO + pd.to_timedelta(rng.integers(0, DIAS_HISTORICO, pares), unit="D")
+    prazo = np.where(tipos == 'day_trade', 0, rng.integers(1, 120, pares))
+    fechamento = abertura + pd.to_timedelta(prazo, unit="D")
+
+    ativo = np.where(tipos == 'fii', rng.choice(fiis, pares), rng.choice(acoes, pares)).astype(object)
+    tipo_mercado = np.where(tipos == 'fii', "FRACIONARIO", "VISTA").astype(object)
+    vencimento = np.full(pares, "", dtype=object)
+
+    # Opções: série vencendo no mês da abertura ou nos dois seguintes (formato MM/YY)
+    opcao = tipos == 'opcao'
+    meses_venc = (abertura.to_period("M") + rng.integers(0, 3, pares)).to_timestamp()
+    strikes = rng.integers(10, 60, pares)
+    ativo[opcao] = (rng.choice(bases_opcao, opcao.sum()) + letras_compra[meses_venc.month[opcao] - 1]
+                    + strikes[opcao].astype(str))
+    tipo_mercado[opcao] = "OPCAO DE COMPRA"
+    vencimento[opcao] = meses_venc[opcao].strftime("%m/%y")
+    # Opções fechadas antes do vencimento; as demais expiram sem fechamento
+    fecha = ~opcao | (rng.random(pares) < 0.6)
+    fechamento = fechamento.where(~opcao, np.minimum(fechamento, meses_venc + pd.offsets.MonthEnd(0)))
+
+    quantidade = np.where(opcao, rng.integers(1, 50, pares) * 100, rng.integers(1, 20, pares) * 100)
+    preco = np.where(opcao, rng.uniform(0.05, 3.0, pares), rng.uniform(5.0, 120.0, pares))
+    variacao = rng.normal(1.0, 0.05, pares)
+    # Venda a descoberto: vende primeiro e recompra depois
+    primeiro = np.where(tipos == 'descoberto', "V", "C")
+    segundo = np.where(tipos == 'descoberto', "C", "V")
+
+    def _perna(datas, sentido, precos, selecao):
+        valor = np.round(quantidade * precos, 2)[selecao]
+        return pd.DataFrame({
+            'Data Pregao': np.asarray(datas)[selecao],
+            'Titulo': ativo[selecao],
+            'Tipo Mercado': tipo_mercado[selecao],
+            'Vencimento': vencimento[selecao],
+            'CompraVenda': sentido[selecao],
+            'D/C': np.where(sentido[selecao] == "C", "D", "C"),
+            'Valor': valor,
+            'Quantidade': quantidade[selecao],
+            'Taxas': np.round(valor * 0.0003 + 2.5, 2),
+        })
+
+    df = pd.concat([
+        _perna(abertura, primeiro, preco, np.ones(pares, dtype=bool)),
+        _perna(fechamento, segundo, preco * variacao, fecha),
+    ], ignore_index=True)
+    return df.sample(frac=1.0, random_state=semente).reset_index(drop=True)
+
+
+def _etapas(df_operacoes: pd.DataFrame):
+    """Executa o cálculo etapa a etapa, na mesma sequência de 'calcular_ir'."""
+    estado = {}
+
+    def preparacao():
+        estado['df'] = ir_calculator._normalizar_operacoes(df_operacoes)
+
+    def categorizacao():
+        estado['df']['Categoria'] = ir_calculator._classificar_categorias(estado['df'])
+        estado['opcoes'], estado['outros'] = ir_calculator._separar_opcoes(estado['df'])
+        estado['apuracao'] = estado['df']['Data Pregao'].max()
+
+    def opcoes():
+        estado['eventos_opcoes'] = ir_calculator._processar_opcoes(estado['opcoes'], estado['apuracao'])
+
+    def outros_ativos():
+        estado['eventos_outros'] = ir_calculator._processar_outros_ativos(estado['outros'])
+
+    def apuracao_mensal():
+        df_resumo = ir_calculator._resumir_eventos([estado['eventos_opcoes'], estado['eventos_outros']])
+        ir_calculator._apurar_meses(df_resumo)
+
+    return [preparacao, categorizacao, opcoes, outros_ativos, apuracao_mensal]
+
+
+def medir(df_operacoes: pd.DataFrame, repeticoes: int) -> dict:
+    """{etapa: (mediana do tempo em s, pico de memória em bytes)}."""
+    tempos = {}
+    picos = {}
+    # Os avisos de posições de opções expiradas não são exibidos
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeticoes):
+            for etapa in _etapas(df_operacoes):
+                inicio = time.perf_counter()
+                etapa()
+                tempos.setdefault(etapa.__name__, []).append(time.perf_counter() - inicio)
+
+        # Memória em uma passada separada: o rastreamento deixa a execução mais lenta
+        tracemalloc.start()
+        try:
+            for etapa in _etapas(df_operacoes):
+                tracemalloc.reset_peak()
+                atual = tracemalloc.get_traced_memory()[0]
+                etapa()
+                picos[etapa.__name__] = tracemalloc.get_traced_memory()[1] - atual
+        finally:
+            tracemalloc.stop()
+
+    return {nome: (statistics.median(valores), picos[nome]) for nome, valores in tempos.items()}
+
+
+def _imprimir(n: int, resultados: dict):
+    print(f"\n{n:,} operações".replace(",", "."))
+    total = 0.0
+    for etapa, (tempo, pico) in resultados.items():
+        total += tempo
+        print(f"  {etapa:<16} {tempo * 1000:10.1f} ms   pico {pico / 2**20:8.1f} MiB")
+    print(f"  {'total':<16} {total * 1000:10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do cálculo de IR por etapa")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args()
+
+    for n in args.tamanhos:
+        df = gerar_operacoes(n, args.semente)
+        _imprimir(len(df), medir(df, args.repeticoes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/inicializacao.py
+# Mede o tempo de partida a frio do app: cada amostra roda em um processo Python novo.
+#
+#   python benchmarks/inicializacao.py                    # árvore atual
+#   python benchmarks/inicializacao.py --referencia HEAD~1  # compara com outra revisão
+#
+# Métricas:
+#   import_database  tempo de 'import database' (com streamlit e pandas já importados),
+#                    pago antes de qualquer elemento da página ser renderizado;
+#   execucao_app     execução completa de 'app.py' via streamlit.testing (AppTest),
+#                    equivalente a uma sessão nova de 'streamlit run app.py'.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CODIGO_IMPORT = """
+import time
+import streamlit, pandas
+inicio = time.perf_counter()
+import database
+print(time.perf_counter() - inicio)
+"""
+
+_CODIGO_APP = """
+import time
+from streamlit.testing.v1 import AppTest
+inicio = time.perf_counter()
+AppTest.from_file("app.py", default_timeout=120).run()
+print(time.perf_counter() - inicio)
+"""
+
+
+def _medir(codigo: str, diretorio: str, repeticoes: int) -> list:
+    tempos = []
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=diretorio,
+            capture_output=True, text=True, check=True
+        )
+        tempos.append(float(saida.stdout.strip().splitlines()[-1]))
+    return tempos
+
+
+def medir_arvore(diretorio: str, repeticoes: int) -> dict:
+    return {
+        'import_database': _medir(_CODIGO_IMPORT, diretorio, repeticoes),
+        'execucao_app': _medir(_CODIGO_APP, diretorio, repeticoes),
+    }
+
+
+def _extrair_revisao(revisao: str, destino: str):
+    arquivo = subprocess.run(
+        ["git", "archive", revisao], cwd=RAIZ, capture_output=True, check=True
+    ).stdout
+    subprocess.run(["tar", "-x", "-C", destino], input=arquivo, check=True)
+
+
+def _imprimir(rotulo: str, resultados: dict):
+    print(f"\n{rotulo}")
+    for metrica, tempos in resultados.items():
+        print(f"  {metrica:<16} mediana {statistics.median(tempos) * 1000:8.1f} ms"
+              f"   (mín {min(tempos) * 1000:.1f} / máx {max(tempos) * 1000:.1f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização do app")
+    parser.add_argument("--referencia", help="revisão do git para comparação (ex.: HEAD~1)")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.referencia:
+        with tempfile.TemporaryDirectory() as diretorio:
+            _extrair_revisao(args.referencia, diretorio)
+            _imprimir(f"Referência ({args.referencia})", medir_arvore(diretorio, args.repeticoes))
+    _imprimir("Árvore atual", medir_arvore(RAIZ, args.repeticoes))
+
+
+if __name__ == "__main__":
+    main()
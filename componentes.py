@@ -0,0 +1,74 @@
+# componentes.py
+# Componentes de interface reutilizados pelo app.py e pelo dashboard.py.
+
+import math
+
+import pandas as pd
+import streamlit as st
+
+TAMANHOS_PAGINA = [25, 50, 100, 250]
+
+
+def paginar_dataframe(df: pd.DataFrame, ordenar_por, crescente: bool, filtro: str,
+                      limite: int, deslocamento: int):
+    """
+    Implementação de 'buscar_pagina' para dados já em memória (cópia local do
+    Firestore): filtra, ordena e devolve só a fatia pedida e o total de linhas.
+    """
+    if filtro:
+        colunas_texto = [c for c in df.columns if df[c].dtype == object or pd.api.types.is_string_dtype(df[c])]
+        mascara = pd.Series(False, index=df.index)
+        for coluna in colunas_texto:
+            mascara |= df[coluna].astype(str).str.contains(filtro, case=False, regex=False, na=False)
+        df = df[mascara]
+    if ordenar_por:
+        df = df.sort_values(ordenar_por, ascending=crescente, kind='stable', na_position='last')
+    return df.iloc[deslocamento:deslocamento + limite], len(df)
+
+
+def tabela_paginada(chave: str, buscar_pagina, colunas: list, formatar_pagina=None, **kwargs_dataframe):
+    """
+    Exibe uma tabela paginada com tamanho de página, ordenação e filtro de texto.
+    Só a página visível é buscada e enviada ao navegador.
+
+    Args:
+        chave: prefixo único para os widgets no st.session_state.
+        buscar_pagina: função (ordenar_por, crescente, filtro, limite, deslocamento)
+            que retorna (DataFrame da página, total de linhas após o filtro).
+        colunas: colunas oferecidas para ordenação.
+        formatar_pagina: função opcional aplicada à página antes da exibição
+            (ex.: conversões e Styler.format), que roda apenas sobre a fatia visível.
+        kwargs_dataframe: argumentos repassados ao st.dataframe.
+    """
+    col_filtro, col_ordem, col_sentido, col_tamanho = st.columns([3, 2, 1, 1])
+    with col_filtro:
+        filtro = st.text_input("Filtrar", key=f"{chave}_filtro", placeholder="Buscar em todas as colunas")
+    with col_ordem:
+        ordenar_por = st.selectbox("Ordenar por", [None] + list(colunas), key=f"{chave}_ordem",
+                                   format_func=lambda c: "—" if c is None else c)
+    with col_sentido:
+        crescente = st.radio("Sentido", ["↑", "↓"], key=f"{chave}_sentido", horizontal=True) == "↑"
+    with col_tamanho:
+        limite = st.selectbox("Linhas", TAMANHOS_PAGINA, key=f"{chave}_tamanho")
+
+    chave_pagina = f"{chave}_pagina"
+    pagina = st.session_state.get(chave_pagina, 1)
+    df_pagina, total = buscar_pagina(ordenar_por, crescente, filtro, limite, (pagina - 1) * limite)
+    total_paginas = max(1, math.ceil(total / limite))
+    if pagina > total_paginas:
+        # O filtro ou o tamanho da página mudou: volta para a última página válida
+        pagina = total_paginas
+        df_pagina, total = buscar_pagina(ordenar_por, crescente, filtro, limite, (pagina - 1) * limite)
+    st.session_state[chave_pagina] = pagina
+
+    if formatar_pagina is not None:
+        df_pagina = formatar_pagina(df_pagina)
+    st.dataframe(df_pagina, **kwargs_dataframe)
+
+    col_pagina, col_info = st.columns([1, 3])
+    with col_pagina:
+        st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key=chave_pagina)
+    with col_info:
+        inicio = (pagina - 1) * limite + 1 if total else 0
+        fim = min(pagina * limite, total)
+        st.caption(f"Mostrando {inicio}–{fim} de {total} linha(s) · página {pagina} de {total_paginas}")
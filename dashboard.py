@@ -3,19 +3,22 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 
+import banco_sqlite
+from componentes import tabela_paginada
+
 st.set_page_config(page_title="Dashboard de Notas de Corretagem", layout="wide")
 st.title("📊 Dashboard de Acompanhamento de Notas de Corretagem")
 
 # Função para carregar dados do banco de dados
-def carregar_dados_do_banco(nome_tabela: str) -> pd.DataFrame:
-    conn = sqlite3.connect("notas_corretagem.db")
+# 'colunas' limita as colunas lidas e 'filtros' ({coluna: valor}) vira um WHERE com
+# igualdades, para que o SQLite devolva apenas o necessário. A conexão e o cache de
+# leituras ficam em 'banco_sqlite': tabelas que não mudaram não são relidas.
+def carregar_dados_do_banco(nome_tabela: str, colunas: list = None, filtros: dict = None) -> pd.DataFrame:
     try:
-        df = pd.read_sql_query(f"SELECT * FROM {nome_tabela}", conn)
-    except pd.io.sql.DatabaseError as e:
+        df = banco_sqlite.ler_tabela(nome_tabela, colunas=colunas, filtros=filtros)
+    except (pd.io.sql.DatabaseError, sqlite3.Error) as e:
         st.warning(f"Tabela '{nome_tabela}' não encontrada ou vazia no banco de dados.")
         df = pd.DataFrame() # Retorna um DataFrame vazio se a tabela não existir
-    finally:
-        conn.close()
     return df
 
 # --- Carregar e Exibir Dados do Cabeçalho ---
@@ -30,20 +33,20 @@ if not df_cabecalho.empty:
 
     col1, col2 = st.columns(2)
     with col1:
-        corretoras_unicas = df_cabecalho['corretora'].unique()
+        corretoras_unicas = banco_sqlite.corretoras_distintas()
         corretora_selecionada = st.selectbox("Filtrar por Corretora", ["Todas"] + list(corretoras_unicas))
         
         if corretora_selecionada != "Todas":
-            df_filtrado = df_cabecalho[df_cabecalho['corretora'] == corretora_selecionada]
+            df_filtrado = carregar_dados_do_banco("notas_cabecalho", filtros={'corretora': corretora_selecionada})
             st.write(f"Notas da {corretora_selecionada}:")
             st.dataframe(df_filtrado, hide_index=True)
-        else:
-            df_filtrado = df_cabecalho
 
     with col2:
         st.write("Contagem de Notas por Corretora:")
-        contagem_corretoras = df_filtrado['corretora'].value_counts().reset_index()
-        contagem_corretoras.columns = ['Corretora', 'Quantidade de Notas']
+        # Contagem feita no banco (GROUP BY)
+        contagem_corretoras = banco_sqlite.contagem_notas_por_corretora(
+            None if corretora_selecionada == "Todas" else corretora_selecionada
+        )
         st.dataframe(contagem_corretoras, hide_index=True)
 
 else:
@@ -53,19 +56,24 @@ else:
 # --- Carregar e Exibir Dados de Operações ---
 st.markdown("---")
 st.subheader("Detalhes das Operações")
-df_operacoes = carregar_dados_do_banco("operacoes")
-if not df_operacoes.empty:
-    st.dataframe(df_operacoes, use_container_width=True)
+# A tabela é paginada no banco: só a página visível é lida e enviada ao navegador
+colunas_operacoes = banco_sqlite.colunas_da_tabela("operacoes")
+total_operacoes = banco_sqlite.consultar("SELECT COUNT(*) AS total FROM operacoes")['total'].iloc[0] \
+    if colunas_operacoes else 0
+if total_operacoes:
+    tabela_paginada(
+        "operacoes",
+        lambda ordem, crescente, filtro, limite, deslocamento: banco_sqlite.pagina_tabela(
+            "operacoes", ordem, crescente, filtro, limite, deslocamento),
+        colunas_operacoes,
+        use_container_width=True, hide_index=True
+    )
 
     # Exemplo de Análise de Operações: Valor total por Tipo Mercado
     st.markdown("##### Resumo de Valores por Tipo de Mercado")
-    if 'Tipo Mercado' in df_operacoes.columns and 'Valor' in df_operacoes.columns:
-        # Converter 'Valor' para numérico
-        df_operacoes['Valor'] = pd.to_numeric(df_operacoes['Valor'], errors='coerce')
-        # Remover NaNs que podem surgir da conversão
-        df_operacoes.dropna(subset=['Valor'], inplace=True)
-
-        resumo_valor_mercado = df_operacoes.groupby('Tipo Mercado')['Valor'].sum().reset_index()
+    if 'Tipo Mercado' in colunas_operacoes and 'Valor' in colunas_operacoes:
+        # Soma feita no banco (GROUP BY), sem converter a tabela inteira no pandas
+        resumo_valor_mercado = banco_sqlite.valor_por_tipo_mercado()
         st.dataframe(resumo_valor_mercado, hide_index=True)
     else:
         st.info("Colunas 'Tipo Mercado' ou 'Valor' não encontradas no DataFrame de operações.")
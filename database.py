@@ -1,76 +1,196 @@
 # database.py (Versão ajustada para Google Firestore)
 
+import datetime
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.api_core import exceptions
+
+import espelho_local
+from normalizacao_ativos import COLUNA_TITULO_ORIGINAL, normalizar_operacoes, normalizar_titulos
+from agregados import (
+    COLECAO_AGREGADOS, CHAVES_AGREGADO, METRICAS_AGREGADO,
+    calcular_agregados_mensais, id_agregado
+)
 
 # --- 1. INICIALIZAÇÃO E CONEXÃO COM O FIREBASE ---
-# Esta função garante que a conexão seja feita apenas uma vez.
+# O cliente é criado sob demanda, na primeira função que precisa do banco, e
+# reaproveitado por todo o processo (st.cache_resource). Os módulos do Firebase
+# também só são importados nesse momento, para não atrasar a primeira renderização.
 
-def inicializar_firebase():
+@st.cache_resource(show_spinner=False)
+def _criar_cliente_firestore():
     """
     Inicializa a conexão com o Firebase usando as credenciais armazenadas
     nos Secrets do Streamlit. Retorna a instância do cliente do Firestore.
+    Em caso de falha levanta a exceção, que não fica em cache: a próxima chamada
+    tenta de novo (por exemplo, depois de corrigidos os Secrets).
     """
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
     if not firebase_admin._apps:
-        try:
-            # Carrega as credenciais a partir dos "Secrets" do Streamlit
-            creds_dict = {
-              "type": st.secrets["firebase"]["type"],
-              "project_id": st.secrets["firebase"]["project_id"],
-              "private_key_id": st.secrets["firebase"]["private_key_id"],
-              # A chave privada precisa ter as quebras de linha restauradas
-              "private_key": st.secrets["firebase"]["private_key"].replace('\\n', '\n'),
-              "client_email": st.secrets["firebase"]["client_email"],
-              "client_id": st.secrets["firebase"]["client_id"],
-              "auth_uri": st.secrets["firebase"]["auth_uri"],
-              "token_uri": st.secrets["firebase"]["token_uri"],
-              "auth_provider_x509_cert_url": st.secrets["firebase"]["auth_provider_x509_cert_url"],
-              "client_x509_cert_url": st.secrets["firebase"]["client_x509_cert_url"]
-            }
-            creds = credentials.Certificate(creds_dict)
-            firebase_admin.initialize_app(creds)
-        except Exception as e:
-            st.error(f"Falha ao inicializar o Firebase. Verifique seus Secrets: {e}")
-            return None
-            
+        # Carrega as credenciais a partir dos "Secrets" do Streamlit
+        creds_dict = {
+          "type": st.secrets["firebase"]["type"],
+          "project_id": st.secrets["firebase"]["project_id"],
+          "private_key_id": st.secrets["firebase"]["private_key_id"],
+          # A chave privada precisa ter as quebras de linha restauradas
+          "private_key": st.secrets["firebase"]["private_key"].replace('\\n', '\n'),
+          "client_email": st.secrets["firebase"]["client_email"],
+          "client_id": st.secrets["firebase"]["client_id"],
+          "auth_uri": st.secrets["firebase"]["auth_uri"],
+          "token_uri": st.secrets["firebase"]["token_uri"],
+          "auth_provider_x509_cert_url": st.secrets["firebase"]["auth_provider_x509_cert_url"],
+          "client_x509_cert_url": st.secrets["firebase"]["client_x509_cert_url"]
+        }
+        creds = credentials.Certificate(creds_dict)
+        firebase_admin.initialize_app(creds)
+
     return firestore.client()
 
-# Inicializa o cliente do Firestore
-db = inicializar_firebase()
+
+# Erro da última tentativa de inicialização (None se ela funcionou)
+_erro_inicializacao = None
+
+
+def inicializar_firebase():
+    """
+    Retorna o cliente do Firestore, ou None se a inicialização falhar. A falha não
+    é exibida aqui (a função é chamada por todas as leituras e gravações): a página
+    mostra 'erro_inicializacao_firebase' uma vez.
+    """
+    global _erro_inicializacao
+    try:
+        db = _criar_cliente_firestore()
+    except Exception as e:
+        _erro_inicializacao = e
+        return None
+    _erro_inicializacao = None
+    return db
+
+
+def erro_inicializacao_firebase():
+    """Exceção da última tentativa de inicializar o Firebase, ou None."""
+    return _erro_inicializacao
+
+
+def _importar_modulos_firebase():
+    try:
+        import firebase_admin.firestore  # noqa: F401
+    except Exception as e:
+        print(f"Falha ao pré-carregar os módulos do Firebase: {e}")
+
+
+def aquecer_conexao():
+    """
+    Pré-carrega em segundo plano os módulos do Firebase (a parte mais lenta da
+    inicialização), sem bloquear a página. O cliente em si continua sendo criado
+    na primeira chamada a 'inicializar_firebase'.
+    """
+    threading.Thread(target=_importar_modulos_firebase, name="aquecer-firebase", daemon=True).start()
 
 
 # --- 2. FUNÇÃO 'salvar_em_banco' ---
 # Lógica: Itera sobre o DataFrame e salva cada linha como um "documento" no Firestore.
+# Cada documento recebe o carimbo de ingestão (horário do servidor), usado pela
+# sincronização incremental de 'carregar_dados_do_banco'.
+
+# Campo interno com o instante de gravação do documento (não é exibido no app)
+CAMPO_INGESTAO = "_ingerido_em"
+# 'Data Pregao' é gravada como texto 'dd/mm/aaaa' (formato legado) e também como
+# data nativa no campo interno abaixo, que permite filtros por período no Firestore
+CAMPO_DATA_PREGAO = "Data Pregao"
+CAMPO_DATA_TIPADA = "_data_pregao"
+
+
+def _data_pregao_tipada(valor):
+    """Converte o valor de 'Data Pregao' (texto 'dd/mm/aaaa' ou datetime) em datetime UTC."""
+    data = pd.to_datetime(valor, format='%d/%m/%Y', errors='coerce') if isinstance(valor, str) \
+        else pd.to_datetime(valor, errors='coerce')
+    if pd.isna(data):
+        return None
+    return datetime.datetime(data.year, data.month, data.day, tzinfo=datetime.timezone.utc)
+
+
+# Limite de gravações por lote (batch) do Firestore. Cada operação pode gerar
+# também um incremento de agregado mensal, por isso o lote de operações é menor.
+LIMITE_LOTE = 500
+OPERACOES_POR_LOTE = 200
 
 def salvar_em_banco(df: pd.DataFrame, collection_name: str):
     """
     Salva cada linha de um DataFrame como um documento em uma coleção do Firestore.
+    As gravações são feitas em lotes; para 'operacoes', o mesmo lote atualiza os
+    agregados mensais (ver 'agregados.py').
     """
+    from firebase_admin import firestore
+
+    db = inicializar_firebase()
     if db is None or df.empty:
         st.warning(f"Conexão com o banco de dados falhou ou não há dados para salvar em '{collection_name}'.")
         return
 
+    if collection_name == "operacoes":
+        # Nome do ativo padronizado pelo ativo_mapeamento.csv (também nos agregados)
+        df = normalizar_operacoes(df.copy())
     records = df.to_dict('records')
     
     for record in records:
+        # Converte tipos de dados que não são nativos do JSON (ex: Timestamps do Pandas)
+        for key, value in record.items():
+            if pd.isna(value):
+                record[key] = None # Converte NaT/NaN para None
+            elif isinstance(value, pd.Timestamp):
+                record[key] = value.to_pydatetime()
+        if record.get(CAMPO_DATA_PREGAO) is not None:
+            record[CAMPO_DATA_TIPADA] = _data_pregao_tipada(record[CAMPO_DATA_PREGAO])
+            if isinstance(record[CAMPO_DATA_PREGAO], datetime.date):
+                record[CAMPO_DATA_PREGAO] = record[CAMPO_DATA_PREGAO].strftime('%d/%m/%Y')
+        record[CAMPO_INGESTAO] = firestore.SERVER_TIMESTAMP
+
+    atualiza_agregados = collection_name == "operacoes"
+    tamanho_lote = OPERACOES_POR_LOTE if atualiza_agregados else LIMITE_LOTE
+    collection_ref = db.collection(collection_name)
+    erros = 0
+    for inicio in range(0, len(records), tamanho_lote):
+        lote = records[inicio:inicio + tamanho_lote]
         try:
-            # Converte tipos de dados que não são nativos do JSON (ex: Timestamps do Pandas)
-            for key, value in record.items():
-                if pd.isna(value):
-                    record[key] = None # Converte NaT/NaN para None
-                elif isinstance(value, pd.Timestamp):
-                    record[key] = value.to_pydatetime()
-            
-            # Adiciona o documento à coleção (o Firestore gerará um ID único)
-            db.collection(collection_name).add(record)
+            batch = db.batch()
+            for record in lote:
+                # Documento com ID gerado pelo Firestore
+                batch.set(collection_ref.document(), record)
+            if atualiza_agregados:
+                _incrementar_agregados(db, batch, df.iloc[inicio:inicio + tamanho_lote])
+            batch.commit()
         except Exception as e:
-            st.error(f"Erro ao salvar registro na coleção '{collection_name}': {e}")
-            st.json(record) # Mostra o registro que causou o erro para depuração
-            
-    st.success(f"Dados salvos com sucesso na coleção '{collection_name}'.")
+            erros += 1
+            st.error(f"Erro ao salvar registros {inicio + 1} a {inicio + len(lote)} na coleção '{collection_name}': {e}")
+
+    # Força a próxima leitura a buscar os documentos recém-gravados
+    invalidar_sincronizacao(collection_name)
+    if atualiza_agregados:
+        invalidar_sincronizacao(COLECAO_AGREGADOS)
+    _consultar_firestore.clear()
+    if not erros:
+        st.success(f"Dados salvos com sucesso na coleção '{collection_name}'.")
+
+
+def _incrementar_agregados(db, batch, df_operacoes: pd.DataFrame):
+    """Adiciona ao lote os incrementos dos agregados mensais das operações."""
+    from firebase_admin import firestore
+
+    colecao = db.collection(COLECAO_AGREGADOS)
+    for linha in calcular_agregados_mensais(df_operacoes).to_dict('records'):
+        chaves = {campo: linha[campo] for campo in CHAVES_AGREGADO}
+        metricas = {campo: firestore.Increment(linha[campo].item() if hasattr(linha[campo], 'item') else linha[campo])
+                    for campo in METRICAS_AGREGADO}
+        ref = colecao.document(id_agregado(*chaves.values()))
+        batch.set(ref, {**chaves, **metricas, CAMPO_INGESTAO: firestore.SERVER_TIMESTAMP}, merge=True)
 
 
 # --- 3. FUNÇÃO 'nota_existe' ---
@@ -81,6 +201,9 @@ def nota_existe(numero_nota: str, data_pregao: str, cnpj_corretora: str) -> bool
     """
     Verifica se uma nota de corretagem com o mesmo número, data e CNPJ já existe no Firestore.
     """
+    from google.api_core import exceptions
+
+    db = inicializar_firebase()
     if db is None:
         st.error("Conexão com o banco de dados indisponível para verificar duplicidade.")
         return False
@@ -104,27 +227,509 @@ def nota_existe(numero_nota: str, data_pregao: str, cnpj_corretora: str) -> bool
 
 
 # --- 4. FUNÇÃO 'carregar_dados_do_banco' ---
-# Lógica: Busca todos os "documentos" de uma "coleção" e os transforma em um DataFrame.
+# Lógica: Mantém em memória uma cópia de cada coleção e, a cada atualização, busca
+# apenas os documentos gravados depois da última marca d'água (watermark) vista.
+# O custo de uma atualização passa a depender só dos dados novos.
+
+# Intervalo mínimo entre consultas ao Firestore para a mesma coleção (segundos)
+INTERVALO_MINIMO_SYNC = 60
+# Folga aplicada à watermark para tolerar gravações concorrentes; duplicatas são
+# descartadas pelo ID do documento
+MARGEM_WATERMARK = datetime.timedelta(minutes=1)
+WATERMARK_INICIAL = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# nome da coleção -> {'df': DataFrame indexado pelo ID do documento,
+#                     'watermark': maior carimbo de ingestão visto,
+#                     'ultima_sync': instante (time.monotonic) da última consulta,
+#                     'versao': token da versão dos dados (ver 'versao_colecao')}
+_estado_colecoes = {}
+_locks_colecoes = defaultdict(threading.Lock)
+# Fonte das versões: um único contador para todas as coleções, de modo que uma
+# coleção descartada e recarregada nunca repita uma versão anterior
+_contador_versoes = itertools.count(1)
+
+
+def invalidar_sincronizacao(nome_tabela: str):
+    """
+    Faz com que a próxima chamada a 'carregar_dados_do_banco' consulte o Firestore,
+    mesmo que o intervalo mínimo ainda não tenha passado.
+    """
+    estado = _estado_colecoes.get(nome_tabela)
+    if estado is not None:
+        estado['ultima_sync'] = 0.0
+
+
+def versao_colecao(nome_tabela: str):
+    """
+    Token da versão dos dados da coleção em memória, ou None se ela ainda não foi
+    carregada. É um inteiro que só cresce e muda sempre que o conteúdo muda, de modo
+    que cálculos derivados podem usá-lo como chave de cache (ver 'resultado_em_cache')
+    sem olhar os dados. Deve ser lido antes dos dados a que se refere.
+    """
+    estado = _estado_colecoes.get(nome_tabela)
+    return None if estado is None else estado['versao']
+
+
+def _tipar_data_pregao(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Substitui 'Data Pregao' por uma coluna datetime, usando o campo tipado quando
+    existe e convertendo o texto legado só nos documentos que não o têm. Feito uma
+    vez na entrada do cache, para que as telas não precisem reconverter as datas.
+    """
+    if CAMPO_DATA_PREGAO not in df.columns:
+        return df.drop(columns=[CAMPO_DATA_TIPADA], errors='ignore')
+
+    if CAMPO_DATA_TIPADA in df.columns:
+        datas = pd.to_datetime(df[CAMPO_DATA_TIPADA], utc=True, errors='coerce').dt.tz_convert(None)
+    else:
+        datas = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    faltantes = datas.isna()
+    if faltantes.any():
+        legado = df.loc[faltantes, CAMPO_DATA_PREGAO]
+        if not pd.api.types.is_datetime64_any_dtype(legado):
+            legado = pd.to_datetime(legado, format='%d/%m/%Y', errors='coerce')
+        datas[faltantes] = legado
+
+    df = df.drop(columns=[CAMPO_DATA_TIPADA], errors='ignore')
+    df[CAMPO_DATA_PREGAO] = datas
+    return df
+
+
+def _docs_para_dataframe(docs) -> pd.DataFrame:
+    """
+    Converte um iterável de snapshots em DataFrame indexado pelo ID do documento.
+    Os nomes de ativo gravados antes da padronização já saem padronizados.
+    """
+    registros = {doc.id: doc.to_dict() for doc in docs}
+    if not registros:
+        return pd.DataFrame()
+    df = _tipar_data_pregao(pd.DataFrame.from_dict(registros, orient='index'))
+    return normalizar_operacoes(df, CAMPO_ATIVO)
+
+
+def _maior_watermark(df: pd.DataFrame, atual: datetime.datetime) -> datetime.datetime:
+    if CAMPO_INGESTAO not in df.columns:
+        return atual
+    carimbos = df[CAMPO_INGESTAO].dropna()
+    if carimbos.empty:
+        return atual
+    return max(atual, pd.Timestamp(carimbos.max()).to_pydatetime())
+
+
+def _buscar_novos(db, nome_tabela: str, watermark: datetime.datetime) -> pd.DataFrame:
+    """Documentos da coleção com carimbo de ingestão acima da watermark (menos a folga)."""
+    from firebase_admin import firestore
+
+    limite = watermark - MARGEM_WATERMARK
+    query = db.collection(nome_tabela).where(filter=firestore.FieldFilter(CAMPO_INGESTAO, '>', limite))
+    return _docs_para_dataframe(query.stream())
+
+
+def _mesclar_novos(estado: dict, nome_tabela: str, novos: pd.DataFrame):
+    """Incorpora ao estado os documentos novos (substituindo os de mesmo ID)."""
+    if novos.empty:
+        return
+    antigos = estado['df'].drop(index=novos.index, errors='ignore')
+    estado['df'] = pd.concat([antigos, novos]) if not antigos.empty else novos
+    estado['watermark'] = _maior_watermark(novos, estado['watermark'])
+    # Só depois dos dados: quem leu a versão nova lê também os dados novos
+    estado['versao'] = next(_contador_versoes)
+    espelho_local.gravar_documentos(nome_tabela, novos, estado['watermark'])
+
+
+def _sincronizar_em_segundo_plano(db, nome_tabela: str, estado: dict):
+    """
+    Busca no Firestore os documentos novos sem bloquear a renderização da página.
+    A consulta é feita fora do lock da coleção, que fica livre para as leituras;
+    o lock é tomado só para incorporar o resultado.
+    """
+    def _executar():
+        try:
+            marca, inicio = estado['ultima_sync'], time.monotonic()
+            novos = _buscar_novos(db, nome_tabela, estado['watermark'])
+            with _locks_colecoes[nome_tabela]:
+                # O estado pode ter sido descartado enquanto a consulta rodava
+                if _estado_colecoes.get(nome_tabela) is estado:
+                    _mesclar_novos(estado, nome_tabela, novos)
+                    # Uma invalidação durante a consulta (gravação nova) continua valendo
+                    if estado['ultima_sync'] == marca:
+                        estado['ultima_sync'] = inicio
+        except Exception as e:
+            # Sem contexto do Streamlit nesta thread: apenas registra o erro
+            print(f"Erro ao sincronizar '{nome_tabela}' em segundo plano: {e}")
+
+    threading.Thread(target=_executar, name=f"sync-{nome_tabela}", daemon=True).start()
+
+
+def _sincronizar_colecao(db, nome_tabela: str) -> dict:
+    """
+    Atualiza o estado em memória da coleção. Na primeira vez usa o espelho local
+    (se existir) e agenda a atualização remota em segundo plano; sem espelho, lê a
+    coleção inteira. Depois, busca somente documentos com carimbo de ingestão
+    acima da watermark e grava-os também no espelho local.
+    Documentos antigos, sem carimbo, entram apenas na carga completa.
+    Exclusões feitas diretamente no Firestore não são detectadas.
+    """
+    estado = _estado_colecoes.get(nome_tabela)
+    agora = time.monotonic()
+    if estado is not None and agora - estado['ultima_sync'] < INTERVALO_MINIMO_SYNC:
+        return estado
+
+    if estado is None:
+        espelho = espelho_local.ler_colecao(nome_tabela)
+        if espelho is not None:
+            df, watermark = espelho
+            df = normalizar_operacoes(df, CAMPO_ATIVO)
+            # A consulta ao Firestore fica com a thread de fundo: as leituras seguintes
+            # usam o espelho até o intervalo mínimo passar, sem esperar pela rede
+            estado = {'df': df, 'watermark': watermark, 'ultima_sync': agora, 'versao': next(_contador_versoes)}
+            _estado_colecoes[nome_tabela] = estado
+            _sincronizar_em_segundo_plano(db, nome_tabela, estado)
+            return estado
+
+    collection_ref = db.collection(nome_tabela)
+    if estado is None:
+        df = _docs_para_dataframe(collection_ref.stream())
+        estado = {
+            'df': df,
+            'watermark': _maior_watermark(df, WATERMARK_INICIAL),
+            'ultima_sync': agora,
+            'versao': next(_contador_versoes),
+        }
+        espelho_local.gravar_documentos(nome_tabela, df, estado['watermark'])
+    else:
+        _mesclar_novos(estado, nome_tabela, _buscar_novos(db, nome_tabela, estado['watermark']))
+        estado['ultima_sync'] = agora
+
+    _estado_colecoes[nome_tabela] = estado
+    return estado
+
 
 def carregar_dados_do_banco(nome_tabela: str) -> pd.DataFrame:
     """
     Carrega todos os documentos de uma coleção do Firestore e retorna como um DataFrame.
     (O parâmetro foi mantido como 'nome_tabela' para compatibilidade com o resto do app).
+    As chamadas seguintes buscam apenas os documentos novos (ver '_sincronizar_colecao').
     """
+    from google.api_core import exceptions
+
+    db = inicializar_firebase()
     if db is None:
         return pd.DataFrame()
 
     try:
-        docs_ref = db.collection(nome_tabela).stream()
-        docs_list = [doc.to_dict() for doc in docs_ref]
-        
-        if not docs_list:
+        with _locks_colecoes[nome_tabela]:
+            estado = _sincronizar_colecao(db, nome_tabela)
+        df = estado['df']
+        if df.empty:
             return pd.DataFrame() # Retorna DataFrame vazio se a coleção estiver vazia
-            
-        return pd.DataFrame(docs_list)
+        # Devolve uma cópia sem o campo interno para que o chamador possa alterá-la
+        return df.drop(columns=[CAMPO_INGESTAO], errors='ignore').reset_index(drop=True)
     except exceptions.NotFound:
         # A coleção não existe, o que é normal na primeira execução
         return pd.DataFrame()
     except Exception as e:
         st.error(f"Erro ao carregar dados da coleção '{nome_tabela}': {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+
+# --- 5. FUNÇÃO 'consultar_colecao' ---
+# Lógica: Consulta apenas as colunas e documentos necessários. Se a coleção já está
+# sincronizada em memória, filtra a cópia local sem novas leituras; caso contrário,
+# delega a projeção ('select') e os filtros ('where', inclusive o período sobre a
+# data tipada) ao Firestore e guarda cada combinação distinta de parâmetros em cache.
+# Os índices compostos necessários estão em 'firestore.indexes.json'.
+
+CAMPO_CORRETORA = "Corretora"
+CAMPO_ATIVO = "Titulo"
+
+
+def _campo(nome: str) -> str:
+    """Nome do campo no formato aceito pelo Firestore (com crases se tiver espaços ou '/')."""
+    from google.cloud.firestore_v1.field_path import FieldPath
+
+    return FieldPath(nome).to_api_repr()
+
+
+def _aplicar_filtros(df: pd.DataFrame, colunas, data_inicio, data_fim, corretora, ativo) -> pd.DataFrame:
+    """Aplica em memória os mesmos filtros e a projeção de 'consultar_colecao'."""
+    mascara = pd.Series(True, index=df.index)
+    if corretora is not None:
+        mascara &= df.get(CAMPO_CORRETORA) == corretora
+    if ativo is not None:
+        mascara &= df.get(CAMPO_ATIVO) == ativo
+    if data_inicio is not None or data_fim is not None:
+        datas = df[CAMPO_DATA_PREGAO]
+        mascara &= datas.notna()
+        if data_inicio is not None:
+            mascara &= datas >= pd.Timestamp(data_inicio)
+        if data_fim is not None:
+            mascara &= datas <= pd.Timestamp(data_fim)
+    df = df[mascara]
+    if colunas is not None:
+        # Campos ausentes em todos os documentos continuam ausentes no DataFrame
+        df = df[[c for c in colunas if c in df.columns]]
+    else:
+        df = df.drop(columns=[CAMPO_INGESTAO], errors='ignore')
+    return df.reset_index(drop=True)
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _consultar_firestore(_db, nome_tabela: str, colunas: tuple, data_inicio, data_fim, corretora, ativo) -> pd.DataFrame:
+    from firebase_admin import firestore
+
+    query = _db.collection(nome_tabela)
+    if corretora is not None:
+        query = query.where(filter=firestore.FieldFilter(_campo(CAMPO_CORRETORA), '==', corretora))
+    if ativo is not None:
+        query = query.where(filter=firestore.FieldFilter(_campo(CAMPO_ATIVO), '==', ativo))
+    if data_inicio is not None:
+        query = query.where(filter=firestore.FieldFilter(
+            CAMPO_DATA_TIPADA, '>=', _data_pregao_tipada(pd.Timestamp(data_inicio))))
+    if data_fim is not None:
+        query = query.where(filter=firestore.FieldFilter(
+            CAMPO_DATA_TIPADA, '<=', _data_pregao_tipada(pd.Timestamp(data_fim))))
+    if colunas is not None:
+        campos = list(colunas)
+        if CAMPO_DATA_PREGAO in campos:
+            campos.append(CAMPO_DATA_TIPADA)
+        query = query.select([_campo(c) for c in campos])
+
+    df = _docs_para_dataframe(query.stream())
+    if df.empty:
+        return df
+    return _aplicar_filtros(df, colunas, None, None, None, None)
+
+
+def consultar_colecao(nome_tabela: str, colunas: tuple = None, data_inicio: datetime.date = None,
+                      data_fim: datetime.date = None, corretora: str = None, ativo: str = None) -> pd.DataFrame:
+    """
+    Carrega de uma coleção somente as colunas em 'colunas' (todas, se None) e os
+    documentos que atendem aos filtros de corretora, ativo e período de 'Data Pregao'.
+    No Firestore, o filtro por período usa o campo tipado: documentos antigos só
+    entram nele depois de 'preencher_datas_tipadas'.
+    """
+    from google.api_core import exceptions
+
+    db = inicializar_firebase()
+    if db is None:
+        return pd.DataFrame()
+
+    estado = _estado_colecoes.get(nome_tabela)
+    if estado is not None:
+        if estado['df'].empty:
+            return pd.DataFrame()
+        return _aplicar_filtros(estado['df'], colunas, data_inicio, data_fim, corretora, ativo)
+
+    try:
+        return _consultar_firestore(db, nome_tabela, colunas, data_inicio, data_fim, corretora, ativo)
+    except exceptions.NotFound:
+        return pd.DataFrame()
+    except Exception as e:
+        st.error(f"Erro ao consultar a coleção '{nome_tabela}': {e}")
+        return pd.DataFrame()
+
+
+# --- 6. FUNÇÃO 'carregar_colecoes' ---
+# Lógica: Sincroniza várias coleções ao mesmo tempo (uma thread por coleção), de modo
+# que a espera total seja a da coleção mais lenta, e não a soma de todas.
+
+def carregar_colecoes(nomes_tabelas) -> dict:
+    """
+    Carrega em paralelo as coleções informadas e retorna {nome: DataFrame}.
+    As chamadas seguintes a 'carregar_dados_do_banco'/'consultar_colecao' para essas
+    coleções são atendidas pela cópia em memória.
+    """
+    nomes_tabelas = list(nomes_tabelas)
+    db = inicializar_firebase()
+    if db is None or not nomes_tabelas:
+        return {nome: pd.DataFrame() for nome in nomes_tabelas}
+
+    def _sincronizar(nome_tabela):
+        try:
+            with _locks_colecoes[nome_tabela]:
+                _sincronizar_colecao(db, nome_tabela)
+        except Exception:
+            pass # O erro é exibido pela chamada a 'carregar_dados_do_banco' logo abaixo
+
+    with ThreadPoolExecutor(max_workers=len(nomes_tabelas)) as executor:
+        list(executor.map(_sincronizar, nomes_tabelas))
+
+    return {nome: carregar_dados_do_banco(nome) for nome in nomes_tabelas}
+
+
+# --- 7. FUNÇÃO 'preencher_datas_tipadas' ---
+# Lógica: Manutenção única para documentos gravados antes da data tipada existir.
+# Executada pela linha de comando (coleções opcionais; padrão: operacoes):
+#   python database.py
+#   python database.py operacoes resumos_negocios
+
+def preencher_datas_tipadas(nome_tabela: str = "operacoes") -> int:
+    """
+    Grava o campo de data tipada nos documentos da coleção que ainda não o têm.
+    Retorna a quantidade de documentos atualizados.
+    """
+    db = inicializar_firebase()
+    if db is None:
+        return 0
+
+    atualizados = 0
+    batch = db.batch()
+    for doc in db.collection(nome_tabela).stream():
+        dados = doc.to_dict()
+        if dados.get(CAMPO_DATA_TIPADA) is not None or dados.get(CAMPO_DATA_PREGAO) is None:
+            continue
+        batch.update(doc.reference, {CAMPO_DATA_TIPADA: _data_pregao_tipada(dados[CAMPO_DATA_PREGAO])})
+        atualizados += 1
+        if atualizados % 500 == 0: # Limite de operações por lote do Firestore
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    invalidar_sincronizacao(nome_tabela)
+    _consultar_firestore.clear()
+    return atualizados
+
+
+# --- 8. FUNÇÃO 'reconstruir_agregados_mensais' ---
+# Lógica: Recalcula os agregados a partir de todas as operações. Os documentos são
+# sobrescritos (sem 'merge') e os que não existem mais são removidos depois, de
+# modo que a coleção nunca fica vazia durante a reconstrução.
+
+def reconstruir_agregados_mensais() -> int:
+    """Reconstrói a coleção de agregados mensais. Retorna o número de linhas gravadas."""
+    from firebase_admin import firestore
+
+    db = inicializar_firebase()
+    if db is None:
+        return 0
+
+    agregados = calcular_agregados_mensais(carregar_dados_do_banco("operacoes"))
+    colecao = db.collection(COLECAO_AGREGADOS)
+    ids_validos = set()
+    batch, pendentes = db.batch(), 0
+    for linha in agregados.to_dict('records'):
+        doc_id = id_agregado(*(linha[campo] for campo in CHAVES_AGREGADO))
+        ids_validos.add(doc_id)
+        dados = {campo: (valor.item() if hasattr(valor, 'item') else valor) for campo, valor in linha.items()}
+        dados[CAMPO_INGESTAO] = firestore.SERVER_TIMESTAMP
+        batch.set(colecao.document(doc_id), dados)
+        pendentes += 1
+        if pendentes == LIMITE_LOTE:
+            batch.commit()
+            batch, pendentes = db.batch(), 0
+    for doc in colecao.stream():
+        if doc.id not in ids_validos:
+            batch.delete(doc.reference)
+            pendentes += 1
+            if pendentes == LIMITE_LOTE:
+                batch.commit()
+                batch, pendentes = db.batch(), 0
+    batch.commit()
+
+    # Exclusões não são vistas pela sincronização incremental: descarta os caches
+    _estado_colecoes.pop(COLECAO_AGREGADOS, None)
+    espelho_local.remover_colecao(COLECAO_AGREGADOS)
+    _consultar_firestore.clear()
+    return len(ids_validos)
+
+
+# --- 9. FUNÇÃO 'resultado_em_cache' ---
+# Lógica: Cálculos pesados derivados de uma coleção (posição, IR, resumos) ficam em
+# memória com a versão da coleção ('versao_colecao'). Um acerto compara só a versão,
+# sem serializar nem copiar os dados, e devolve o mesmo objeto a todos os chamadores.
+
+MAX_RESULTADOS_DERIVADOS = 32
+
+# (coleção, chave) -> (versão da coleção, resultado)
+_resultados_derivados = OrderedDict()
+_lock_derivados = threading.Lock()
+
+
+def resultado_em_cache(nome_tabela: str, versao, chave, calcular):
+    """
+    Retorna 'calcular()' para a versão 'versao' da coleção, calculando apenas na
+    primeira chamada com essa (chave, versão). 'chave' identifica o cálculo e seus
+    parâmetros (precisa ser hashable). Com versão None (coleção fora da memória) o
+    cálculo não é guardado.
+    O resultado é compartilhado entre chamadas e sessões: deve ser tratado como
+    somente leitura (quem precisar alterá-lo deve fazer uma cópia).
+    """
+    if versao is None:
+        return calcular()
+    item = (nome_tabela, chave)
+    with _lock_derivados:
+        em_cache = _resultados_derivados.get(item)
+        if em_cache is not None and em_cache[0] == versao:
+            _resultados_derivados.move_to_end(item)
+            return em_cache[1]
+
+    resultado = calcular()
+    with _lock_derivados:
+        em_cache = _resultados_derivados.get(item)
+        # Não sobrescreve um resultado de versão mais nova calculado em paralelo
+        if em_cache is None or em_cache[0] <= versao:
+            _resultados_derivados[item] = (versao, resultado)
+            _resultados_derivados.move_to_end(item)
+            while len(_resultados_derivados) > MAX_RESULTADOS_DERIVADOS:
+                _resultados_derivados.popitem(last=False)
+    return resultado
+
+
+# --- 10. FUNÇÃO 'renormalizar_ativos' ---
+# Lógica: Manutenção para padronizar o nome do ativo nas operações já gravadas (por
+# exemplo, depois de incluir nomes no ativo_mapeamento.csv). Os documentos alterados
+# recebem novo carimbo de ingestão, para que a sincronização incremental os busque,
+# e os agregados mensais são reconstruídos com os nomes novos.
+# O nome da nota fica em 'Titulo Original' (gravado na primeira padronização do
+# documento) e é dele que 'Titulo' é recalculado: nada se perde ao padronizar.
+
+def renormalizar_ativos() -> int:
+    """Regrava 'Titulo' padronizado (e 'Titulo Original', se faltar). Retorna a quantidade alterada."""
+    from firebase_admin import firestore
+
+    db = inicializar_firebase()
+    if db is None:
+        return 0
+
+    referencias, titulos, originais = [], [], []
+    for doc in db.collection("operacoes").stream():
+        dados = doc.to_dict()
+        referencias.append(doc.reference)
+        titulos.append(dados.get(CAMPO_ATIVO))
+        originais.append(dados.get(COLUNA_TITULO_ORIGINAL))
+    titulos = pd.Series(titulos, dtype=object)
+    originais = pd.Series(originais, dtype=object)
+    sem_original = originais.isna()
+    originais = originais.fillna(titulos)
+    padronizados = normalizar_titulos(originais)
+    alterados = ((padronizados != titulos) | sem_original) & originais.notna()
+
+    batch, pendentes = db.batch(), 0
+    for posicao in alterados[alterados].index:
+        batch.update(referencias[posicao], {
+            CAMPO_ATIVO: padronizados[posicao], COLUNA_TITULO_ORIGINAL: originais[posicao],
+            CAMPO_INGESTAO: firestore.SERVER_TIMESTAMP
+        })
+        pendentes += 1
+        if pendentes == LIMITE_LOTE:
+            batch.commit()
+            batch, pendentes = db.batch(), 0
+    batch.commit()
+
+    total = int(alterados.sum())
+    if total:
+        invalidar_sincronizacao("operacoes")
+        _consultar_firestore.clear()
+        reconstruir_agregados_mensais()
+    return total
+
+
+if __name__ == "__main__":
+    import sys
+
+    if inicializar_firebase() is None:
+        print(f"Falha ao inicializar o Firebase. Verifique seus Secrets: {erro_inicializacao_firebase()}")
+        sys.exit(1)
+    for nome in sys.argv[1:] or ["operacoes"]:
+        total = preencher_datas_tipadas(nome)
+        print(f"Data tipada preenchida em '{nome}': {total} documento(s).")
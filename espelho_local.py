@@ -0,0 +1,125 @@
+# espelho_local.py
+# Cópia local (SQLite) das coleções do Firestore. Permite que um processo novo do
+# Streamlit exiba os dados imediatamente, sem esperar a leitura remota; a
+# sincronização com o Firestore continua sendo feita pelo 'database.py'.
+
+import datetime
+import json
+import sqlite3
+import threading
+
+import pandas as pd
+
+import migracoes
+
+CAMINHO_ESPELHO = "espelho_firestore.db"
+# Incrementar quando o formato das tabelas mudar: o espelho é apenas um cache e é
+# recriado do zero a partir do Firestore
+VERSAO_ESPELHO = 2
+
+# 'Data Pregao' fica em coluna própria (data ISO, indexada) em vez de no JSON
+CAMPO_DATA_PREGAO = "Data Pregao"
+
+# Serializa as gravações feitas por threads diferentes no mesmo processo
+_lock_escrita = threading.Lock()
+
+
+def _conectar() -> sqlite3.Connection:
+    return migracoes.conectar_cache_versionado(CAMINHO_ESPELHO, VERSAO_ESPELHO, """
+        CREATE TABLE IF NOT EXISTS sincronizacao (
+            colecao TEXT PRIMARY KEY,
+            watermark TEXT
+        );
+    """)
+
+
+def _criar_tabela(conn: sqlite3.Connection, colecao: str):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{colecao}" (
+            doc_id TEXT PRIMARY KEY,
+            data_pregao TEXT,
+            dados TEXT
+        )
+    """)
+    conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{colecao}_data_pregao" ON "{colecao}" (data_pregao)')
+
+
+def _serializar(valor):
+    """Converte valores que não são nativos do JSON (datas do Firestore)."""
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def ler_colecao(colecao: str):
+    """
+    Lê a cópia local de uma coleção.
+    Retorna (DataFrame indexado pelo ID do documento, watermark) ou None se a
+    coleção ainda não foi espelhada.
+    """
+    try:
+        with _conectar() as conn:
+            linha = conn.execute(
+                "SELECT watermark FROM sincronizacao WHERE colecao = ?", (colecao,)
+            ).fetchone()
+            if linha is None:
+                return None
+            _criar_tabela(conn, colecao)
+            docs = conn.execute(f'SELECT doc_id, data_pregao, dados FROM "{colecao}"').fetchall()
+    except sqlite3.Error as e:
+        print(f"Espelho local indisponível para '{colecao}': {e}")
+        return None
+
+    watermark = datetime.datetime.fromisoformat(linha[0])
+    registros = {doc_id: json.loads(dados) for doc_id, _, dados in docs}
+    if not registros:
+        return pd.DataFrame(), watermark
+    df = pd.DataFrame.from_dict(registros, orient='index')
+    datas = pd.Series([data for _, data, _ in docs], index=df.index)
+    if datas.notna().any():
+        df[CAMPO_DATA_PREGAO] = pd.to_datetime(datas, format='%Y-%m-%d', errors='coerce')
+    return df, watermark
+
+
+def gravar_documentos(colecao: str, df: pd.DataFrame, watermark: datetime.datetime):
+    """
+    Insere ou substitui no espelho os documentos do DataFrame (indexado pelo ID)
+    e registra a watermark correspondente, tudo em uma única transação.
+    """
+    if CAMPO_DATA_PREGAO in df.columns:
+        datas = pd.to_datetime(df[CAMPO_DATA_PREGAO], errors='coerce').dt.strftime('%Y-%m-%d')
+        datas = datas.astype(object).where(datas.notna(), None).tolist()
+        df = df.drop(columns=[CAMPO_DATA_PREGAO])
+    else:
+        datas = [None] * len(df)
+    registros = [
+        (str(doc_id), data, json.dumps({k: v for k, v in doc.items() if not _vazio(v)}, default=_serializar))
+        for doc_id, data, doc in zip(df.index, datas, df.to_dict('records'))
+    ]
+    try:
+        with _lock_escrita, _conectar() as conn:
+            _criar_tabela(conn, colecao)
+            conn.executemany(
+                f'INSERT OR REPLACE INTO "{colecao}" (doc_id, data_pregao, dados) VALUES (?, ?, ?)', registros
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sincronizacao (colecao, watermark) VALUES (?, ?)",
+                (colecao, watermark.isoformat()),
+            )
+    except sqlite3.Error as e:
+        print(f"Falha ao atualizar o espelho local de '{colecao}': {e}")
+
+
+def _vazio(valor) -> bool:
+    # Colunas ausentes em parte dos documentos viram NaN no DataFrame
+    return not isinstance(valor, (list, dict)) and pd.isna(valor)
+
+
+def remover_colecao(colecao: str):
+    """Descarta a cópia local de uma coleção (será recriada na próxima leitura)."""
+    try:
+        with _lock_escrita, _conectar() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS "{colecao}"')
+            conn.execute("DELETE FROM sincronizacao WHERE colecao = ?", (colecao,))
+    except sqlite3.Error as e:
+        print(f"Falha ao remover '{colecao}' do espelho local: {e}")
@@ -1,8 +1,33 @@
+import numpy as np
 import pandas as pd
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pandas.tseries.offsets import MonthEnd
 import re
 
+# Colunas dos eventos realizados (uma linha por fechamento de posição)
+COLUNAS_EVENTOS = ['Ano-Mês', 'Categoria', 'Vendas Totais', 'Lucro Bruto', 'IRRF']
+
+# Custódia de um (ativo, categoria) ao fim de um mês
+COLUNAS_CUSTODIA = ['Ano-Mês', 'Ativo', 'Categoria', 'Qtd Comprada', 'Custo Comprado',
+                    'Qtd Vendida', 'Receita Vendida']
+
+# Alíquota sobre o lucro líquido mensal de cada categoria
+ALIQUOTAS_IR = {
+    'Ações Swing': 0.15,
+    'ETFs Swing': 0.15,
+    'BDRs Swing': 0.15,
+    'Operações a Termo': 0.15,
+    'Day Trade': 0.20,
+    'Opções Swing': 0.15,
+    'Fundos Imobiliários': 0.20,
+}
+# Categorias isentas quando as vendas do mês não passam de LIMITE_ISENCAO
+CATEGORIAS_ISENCAO = {'Ações Swing', 'ETFs Swing', 'BDRs Swing', 'Operações a Termo'}
+LIMITE_ISENCAO = 20000
+# DARF abaixo deste valor é acumulada para os meses seguintes
+VALOR_MINIMO_DARF = 10.0
+
+
 def _parse_vencimento_flex(venc_str):
     """
     Função auxiliar para converter datas de vencimento nos formatos
@@ -29,140 +54,381 @@ def _parse_vencimento_flex(venc_str):
     return pd.to_datetime(venc_str, errors='coerce')
 
 
-def _processar_opcoes(df_opcoes: pd.DataFrame, data_apuracao: pd.Timestamp):
-    eventos_opcoes = []
+def _parse_vencimento_serie(serie: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de '_parse_vencimento_flex' para uma coluna inteira.
+    Os vencimentos se repetem muito, então cada valor distinto é convertido uma
+    única vez: 'MM/YYYY' e 'MM/YY' de uma só vez via regex, os demais textos pela
+    conversão direta do pandas. Valores que não são texto viram NaT.
+    """
+    codigos, valores = pd.factorize(serie)
+    valores = pd.Series(valores, dtype=object)
+    convertidos = pd.Series(pd.NaT, index=valores.index, dtype='datetime64[ns]')
+
+    textos = valores[valores.map(lambda v: isinstance(v, str))]
+    partes = textos.str.extract(r'^\s*(\d{2})/(\d{4}|\d{2})\s*$')
+    mes_ano = partes.dropna()
+    if not mes_ano.empty:
+        # Assume que anos com dois dígitos são de 20xx
+        ano = mes_ano[1].where(mes_ano[1].str.len() == 4, '20' + mes_ano[1]).astype(int)
+        convertidos[mes_ano.index] = pd.to_datetime(
+            pd.DataFrame({'year': ano, 'month': mes_ano[0].astype(int), 'day': 1}), errors='coerce'
+        )
+    for indice in textos.index.difference(mes_ano.index):
+        convertidos[indice] = pd.to_datetime(textos[indice], errors='coerce')
+
+    # Código -1 (valor ausente) aponta para o NaT acrescentado ao final
+    convertidos = np.append(convertidos.to_numpy(), np.datetime64('NaT', 'ns'))
+    return pd.Series(convertidos[codigos], index=serie.index)
+
+
+def _ano_mes(datas) -> np.ndarray:
+    """'AAAA-MM' de cada data, formatado uma vez por mês distinto."""
+    meses = np.asarray(datas).astype('datetime64[M]')
+    codigos, unicos = pd.factorize(meses, use_na_sentinel=False)
+    return np.array([str(m) for m in unicos], dtype=object)[codigos]
+
+
+def _texto_maiusculo(serie: pd.Series) -> np.ndarray:
+    """str(valor).upper() de cada elemento, calculado uma vez por valor distinto."""
+    codigos, valores = pd.factorize(serie, use_na_sentinel=False)
+    return np.array([str(v).upper() for v in valores], dtype=object)[codigos]
+
+
+def _classificar_categorias(df: pd.DataFrame) -> pd.Series:
+    """
+    Classifica cada operação na categoria de apuração do IR.
+    Day Trade: o mesmo ativo teve compra e venda no mesmo pregão. Os demais casos
+    seguem o tipo de mercado e o nome do ativo, nessa ordem de prioridade. O nome
+    considerado é o da nota ('Titulo Original'), quando o ativo foi padronizado
+    para o código de negociação (ver normalizacao_ativos.py).
+    """
+    if df.empty:
+        return pd.Series(index=df.index, dtype=object)
+
+    if 'Tipo Mercado' in df.columns:
+        tipo_mercado = pd.Series(_texto_maiusculo(df['Tipo Mercado']), index=df.index)
+    else:
+        tipo_mercado = pd.Series('', index=df.index)
+    if 'Titulo Original' in df.columns:
+        nome = df['Titulo Original'].fillna(df['Ativo'])
+    else:
+        nome = df['Ativo']
+    ativo = pd.Series(_texto_maiusculo(nome), index=df.index)
+
+    # Compra e venda do mesmo ativo no mesmo dia (ativos nulos não formam grupo)
+    chaves = [df['Ativo'], df['Data Pregao'].dt.normalize()]
+    has_compra = (df['Operacao'] == 'C').groupby(chaves).transform('any')
+    has_venda = (df['Operacao'] == 'V').groupby(chaves).transform('any')
+    day_trade = (has_compra.astype('boolean') & has_venda.astype('boolean')).fillna(False).astype(bool)
+
+    condicoes = [
+        day_trade,
+        tipo_mercado.str.contains('OPCAO', regex=False),
+        ativo.str.contains('FII', regex=False) | tipo_mercado.str.contains('FUNDO IMOB', regex=False),
+        ativo.str.contains('ETF', regex=False),
+        ativo.str.contains('BDR', regex=False),
+        tipo_mercado.str.contains('TERMO', regex=False),
+    ]
+    categorias = ['Day Trade', 'Opções Swing', 'Fundos Imobiliários', 'ETFs Swing',
+                  'BDRs Swing', 'Operações a Termo']
+    return pd.Series(np.select(condicoes, categorias, default='Ações Swing'), index=df.index, dtype=object)
+
+
+def _processar_opcoes(df_opcoes: pd.DataFrame, data_apuracao: pd.Timestamp) -> pd.DataFrame:
+    """
+    Liquidação das opções por série (ativo, vencimento, categoria): quantidades,
+    valores e taxas de compra e de venda vêm de um único groupby pivotado por
+    'Operacao'. Séries zeradas geram o evento no mês da última operação; séries
+    abertas com vencimento em mês anterior ao da apuração, no mês do vencimento.
+    Retorna os eventos (COLUNAS_EVENTOS) na ordem das séries.
+    """
     if df_opcoes.empty:
-        return eventos_opcoes
-    df_opcoes['Vencimento'] = df_opcoes['Vencimento'] + MonthEnd(0)
-    opcoes_agrupadas = df_opcoes.groupby(['Ativo', 'Vencimento', 'Categoria'])
-    for (ativo, vencimento, categoria), group in opcoes_agrupadas:
-        vendas = group[group['Operacao'] == 'V']
-        compras = group[group['Operacao'] == 'C']
-
-        # --- CÓDIGO CORRIGIDO ---
-        # Verifica se a coluna 'Taxas' existe antes de somar para evitar o erro.
-        taxas_vendas = vendas['Taxas'].sum() if 'Taxas' in vendas.columns else 0
-        total_vendido = vendas['Valor'].sum() - taxas_vendas
-
-        taxas_compras = compras['Taxas'].sum() if 'Taxas' in compras.columns else 0
-        total_comprado = compras['Valor'].sum() + taxas_compras
-        # --- FIM DA CORREÇÃO ---
-
-        qtd_vendida = vendas['Quantidade'].sum()
-        qtd_comprada = compras['Quantidade'].sum()
-        data_ultima_op = group['Data Pregao'].max()
-        
-        # Calcula IRRF retido para day trade (1% do lucro) ou swing (0,005% das vendas)
-        irrf = 0.0
-        if categoria == 'Day Trade' and total_vendido > total_comprado:
-            irrf = (total_vendido - total_comprado) * 0.01
-        elif categoria != 'Day Trade':
-            irrf = total_vendido * 0.00005
-            
-        if qtd_comprada == qtd_vendida:
-            lucro_bruto = total_vendido - total_comprado
-            eventos_opcoes.append({
-                'Ano-Mês': data_ultima_op.to_period('M').strftime('%Y-%m'),
-                'Categoria': categoria,
-                'Vendas Totais': total_vendido,
-                'Lucro Bruto': lucro_bruto,
-                'IRRF': irrf
-            })
-        elif vencimento.to_period('M') < data_apuracao.to_period('M'):
-            lucro_bruto = total_vendido - total_comprado
-            eventos_opcoes.append({
-                'Ano-Mês': vencimento.to_period('M').strftime('%Y-%m'),
-                'Categoria': categoria,
-                'Vendas Totais': total_vendido,
-                'Lucro Bruto': lucro_bruto,
-                'IRRF': irrf
-            })
-            
-        if qtd_comprada != qtd_vendida and vencimento < data_apuracao:
-            print(f"Warning: Posição aberta em {ativo} expirada: Qtd Compra {qtd_comprada}, Venda {qtd_vendida}")
-            
-    return eventos_opcoes
-
-
-def _processar_outros_ativos(df_outros: pd.DataFrame):
-    eventos_outros = []
+        return pd.DataFrame(columns=COLUNAS_EVENTOS)
+    chaves = ['Ativo', 'Vencimento', 'Categoria']
+    base = pd.DataFrame({
+        'Ativo': df_opcoes['Ativo'],
+        'Vencimento': df_opcoes['Vencimento'] + MonthEnd(0),
+        'Categoria': df_opcoes['Categoria'],
+        'Operacao': df_opcoes['Operacao'],
+        'Valor': df_opcoes['Valor'],
+        # Sem a coluna 'Taxas' as taxas valem zero
+        'Taxas': pd.to_numeric(df_opcoes['Taxas'], errors='coerce') if 'Taxas' in df_opcoes.columns else 0.0,
+        'Quantidade': df_opcoes['Quantidade'],
+        'Data Pregao': df_opcoes['Data Pregao'],
+    })
+    somas = (base.groupby(chaves + ['Operacao'])[['Valor', 'Taxas', 'Quantidade']].sum()
+                 .unstack('Operacao'))
+    series = base.groupby(chaves)['Data Pregao'].max().to_frame('Ultima Operacao')
+    if series.empty:
+        return pd.DataFrame(columns=COLUNAS_EVENTOS)
+
+    def _coluna(campo, operacao):
+        if (campo, operacao) not in somas.columns:
+            return np.zeros(len(series))
+        return somas[(campo, operacao)].reindex(series.index).fillna(0).to_numpy(dtype=float)
+
+    total_vendido = _coluna('Valor', 'V') - _coluna('Taxas', 'V')
+    total_comprado = _coluna('Valor', 'C') + _coluna('Taxas', 'C')
+    qtd_comprada = _coluna('Quantidade', 'C')
+    qtd_vendida = _coluna('Quantidade', 'V')
+    zerada = qtd_comprada == qtd_vendida
+    vencimento = series.index.get_level_values('Vencimento')
+    categoria = series.index.get_level_values('Categoria').to_numpy()
+
+    # IRRF retido: day trade 1% do lucro, swing 0,005% das vendas
+    irrf = np.where(categoria == 'Day Trade',
+                    np.where(total_vendido > total_comprado, (total_vendido - total_comprado) * 0.01, 0.0),
+                    total_vendido * 0.00005)
+    meses_vencimento = vencimento.to_numpy().astype('datetime64[M]')
+    vencida = ~zerada & (meses_vencimento < np.datetime64(data_apuracao, 'M'))
+
+    for i in np.flatnonzero(~zerada & (vencimento < data_apuracao)):
+        print(f"Warning: Posição aberta em {series.index[i][0]} expirada: "
+              f"Qtd Compra {qtd_comprada[i]:g}, Venda {qtd_vendida[i]:g}")
+
+    gera_evento = zerada | vencida
+    meses = np.where(zerada, _ano_mes(series['Ultima Operacao'].to_numpy()), _ano_mes(meses_vencimento))
+    return pd.DataFrame({
+        'Ano-Mês': meses[gera_evento],
+        'Categoria': categoria[gera_evento],
+        'Vendas Totais': total_vendido[gera_evento],
+        'Lucro Bruto': (total_vendido - total_comprado)[gera_evento],
+        'IRRF': irrf[gera_evento],
+    })
+
+
+def _processar_outros_ativos(df_outros: pd.DataFrame) -> pd.DataFrame:
+    """Eventos realizados de ações, FIIs, ETFs, BDRs e termo (ver '_percorrer_custodia')."""
+    return _percorrer_custodia(df_outros)[0]
+
+
+def _chave_custodia(ativo, categoria) -> tuple:
+    """Chave (ativo, categoria) da custódia; ativo nulo vira None."""
+    return (None if pd.isna(ativo) else ativo, categoria)
+
+
+def _percorrer_custodia(df_outros: pd.DataFrame, estado_inicial: dict = None):
+    """
+    Preço médio de ações, FIIs, ETFs, BDRs e termo, com posições compradas e vendidas.
+    As operações são ordenadas uma única vez por (ativo, categoria), mantendo a ordem
+    original dentro de cada chave, e cada chave é percorrida sobre arrays contíguos.
+    Os eventos realizados vão para colunas pré-alocadas (no máximo um por operação)
+    e são devolvidos na ordem das operações que os geraram, com o índice delas.
+
+    'estado_inicial' ({(ativo, categoria): (qtd comprada, custo, qtd vendida, receita)})
+    continua a custódia de um checkpoint. Retorna (eventos, custódia ao fim de cada
+    mês em que a chave operou, com as colunas de COLUNAS_CUSTODIA).
+    """
     if df_outros.empty:
-        return eventos_outros
-    custodia = defaultdict(lambda: {'long': {'qtd': 0, 'custo': 0.0}, 'short': {'qtd': 0, 'receita': 0.0}})
-    for _, row in df_outros.iterrows():
-        ativo, categoria, op, qtd, valor, data, taxas = \
-            row['Ativo'], row['Categoria'], row['Operacao'], row['Quantidade'], row['Valor'], row['Data Pregao'], row.get('Taxas', 0.0)
-        key = (ativo, categoria)
-        # Calcula IRRF retido
-        irrf = 0.0
-        if op == 'V':
-            irrf = valor * 0.00005 if categoria != 'Day Trade' else (valor - (custodia[key]['long']['custo'] / custodia[key]['long']['qtd'] * qtd if custodia[key]['long']['qtd'] > 0 else 0)) * 0.01
-        if op == 'C':
-            custo_com_taxas = valor + taxas  # Adiciona taxas ao custo de compra
-            posicao_short = custodia[key]['short']
-            if posicao_short['qtd'] > 0:
-                qtd_a_fechar = min(qtd, posicao_short['qtd'])
-                receita_media_venda = posicao_short['receita'] / posicao_short['qtd'] if posicao_short['qtd'] > 0 else 0
-                custo_da_compra_p_fechar = (custo_com_taxas / qtd) * qtd_a_fechar if qtd > 0 else 0
-                lucro_bruto = (receita_media_venda * qtd_a_fechar) - custo_da_compra_p_fechar
-                eventos_outros.append({
-                    'Ano-Mês': data.to_period('M').strftime('%Y-%m'),
-                    'Categoria': categoria,
-                    'Vendas Totais': 0,
-                    'Lucro Bruto': lucro_bruto,
-                    'IRRF': irrf
-                })
-                posicao_short['qtd'] -= qtd_a_fechar
-                posicao_short['receita'] -= (receita_media_venda * qtd_a_fechar)
-                qtd_restante = qtd - qtd_a_fechar
-                if qtd_restante > 0:
-                    custodia[key]['long']['qtd'] += qtd_restante
-                    custodia[key]['long']['custo'] += (custo_com_taxas / qtd) * qtd_restante if qtd > 0 else 0
-            else:
-                custodia[key]['long']['qtd'] += qtd
-                custodia[key]['long']['custo'] += custo_com_taxas
-        elif op == 'V':
-            receita_com_taxas = valor - taxas  # Deduz taxas da receita de venda
-            posicao_long = custodia[key]['long']
-            if posicao_long['qtd'] > 0:
-                qtd_a_vender = min(qtd, posicao_long['qtd'])
-                custo_medio = posicao_long['custo'] / posicao_long['qtd'] if posicao_long['qtd'] > 0 else 0
-                custo_da_venda = custo_medio * qtd_a_vender
-                valor_da_venda = (receita_com_taxas / qtd) * qtd_a_vender if qtd > 0 else 0
-                lucro_bruto = valor_da_venda - custo_da_venda
-                eventos_outros.append({
-                    'Ano-Mês': data.to_period('M').strftime('%Y-%m'),
-                    'Categoria': categoria,
-                    'Vendas Totais': valor_da_venda,
-                    'Lucro Bruto': lucro_bruto,
-                    'IRRF': irrf
-                })
-                posicao_long['qtd'] -= qtd_a_vender
-                posicao_long['custo'] -= custo_da_venda
-                qtd_restante = qtd - qtd_a_vender
-                if qtd_restante > 0:
-                    custodia[key]['short']['qtd'] += qtd_restante
-                    custodia[key]['short']['receita'] += (receita_com_taxas / qtd) * qtd_restante if qtd > 0 else 0
-            else:
-                custodia[key]['short']['qtd'] += qtd
-                custodia[key]['short']['receita'] += receita_com_taxas
-    return eventos_outros
+        return pd.DataFrame(columns=COLUNAS_EVENTOS), pd.DataFrame(columns=COLUNAS_CUSTODIA)
+    estado_inicial = estado_inicial or {}
 
+    chaves = df_outros.groupby(['Ativo', 'Categoria'], sort=False, dropna=False).ngroup().to_numpy()
+    ordem = np.argsort(chaves, kind='stable')
+    chaves = chaves[ordem]
+    # Limites [inicio, fim) de cada chave no array ordenado
+    limites = np.flatnonzero(np.diff(chaves)) + 1
+    inicios = np.concatenate(([0], limites)).tolist()
+    fins = np.concatenate((limites, [len(chaves)])).tolist()
 
-def calcular_ir(df_operacoes: pd.DataFrame, data_apuracao=None) -> pd.DataFrame:
-    if df_operacoes.empty:
-        return pd.DataFrame()
+    operacao = df_outros['Operacao'].to_numpy()[ordem]
+    sentido = np.where(operacao == 'C', 1, np.where(operacao == 'V', -1, 0)).tolist()
+    quantidades = df_outros['Quantidade'].to_numpy(dtype=float)[ordem].tolist()
+    valores = df_outros['Valor'].to_numpy(dtype=float)[ordem].tolist()
+    if 'Taxas' in df_outros.columns:
+        taxas_op = pd.to_numeric(df_outros['Taxas'], errors='coerce').to_numpy(dtype=float)[ordem].tolist()
+    else:
+        taxas_op = [0.0] * len(ordem)
+    ativos = df_outros['Ativo'].to_numpy()[ordem]
+    categorias = df_outros['Categoria'].to_numpy()[ordem]
+    day_trade = (categorias == 'Day Trade').tolist()
+    posicoes = ordem.tolist()
+    # Última operação de cada chave em cada mês: ponto em que a custódia é registrada
+    meses = df_outros['Data Pregao'].to_numpy().astype('datetime64[M]')[ordem]
+    fim_de_mes = np.append((meses[1:] != meses[:-1]) | (chaves[1:] != chaves[:-1]), True).tolist()
+
+    n = len(ordem)
+    pos_evento = np.empty(n, dtype=np.int64)
+    vendas_evento = np.empty(n)
+    lucro_evento = np.empty(n)
+    irrf_evento = np.empty(n)
+    k = 0
+    pos_estado = []
+    estados = []
+
+    for inicio, fim in zip(inicios, fins):
+        chave = _chave_custodia(ativos[inicio], categorias[inicio])
+        qtd_long, custo_long, qtd_short, receita_short = estado_inicial.get(chave, (0.0, 0.0, 0.0, 0.0))
+        for i in range(inicio, fim):
+            op, qtd, valor, taxas = sentido[i], quantidades[i], valores[i], taxas_op[i]
+            # Calcula IRRF retido
+            irrf = 0.0
+            if op == -1:
+                if day_trade[i]:
+                    irrf = (valor - (custo_long / qtd_long * qtd if qtd_long > 0 else 0)) * 0.01
+                else:
+                    irrf = valor * 0.00005
+            if op == 1:
+                custo_com_taxas = valor + taxas  # Adiciona taxas ao custo de compra
+                if qtd_short > 0:
+                    qtd_a_fechar = min(qtd, qtd_short)
+                    receita_media_venda = receita_short / qtd_short
+                    custo_da_compra_p_fechar = (custo_com_taxas / qtd) * qtd_a_fechar if qtd > 0 else 0
+                    pos_evento[k] = posicoes[i]
+                    vendas_evento[k] = 0.0
+                    lucro_evento[k] = (receita_media_venda * qtd_a_fechar) - custo_da_compra_p_fechar
+                    irrf_evento[k] = irrf
+                    k += 1
+                    qtd_short -= qtd_a_fechar
+                    receita_short -= receita_media_venda * qtd_a_fechar
+                    qtd_restante = qtd - qtd_a_fechar
+                    if qtd_restante > 0:
+                        qtd_long += qtd_restante
+                        custo_long += (custo_com_taxas / qtd) * qtd_restante if qtd > 0 else 0
+                else:
+                    qtd_long += qtd
+                    custo_long += custo_com_taxas
+            elif op == -1:
+                receita_com_taxas = valor - taxas  # Deduz taxas da receita de venda
+                if qtd_long > 0:
+                    qtd_a_vender = min(qtd, qtd_long)
+                    custo_da_venda = custo_long / qtd_long * qtd_a_vender
+                    valor_da_venda = (receita_com_taxas / qtd) * qtd_a_vender if qtd > 0 else 0
+                    pos_evento[k] = posicoes[i]
+                    vendas_evento[k] = valor_da_venda
+                    lucro_evento[k] = valor_da_venda - custo_da_venda
+                    irrf_evento[k] = irrf
+                    k += 1
+                    qtd_long -= qtd_a_vender
+                    custo_long -= custo_da_venda
+                    qtd_restante = qtd - qtd_a_vender
+                    if qtd_restante > 0:
+                        qtd_short += qtd_restante
+                        receita_short += (receita_com_taxas / qtd) * qtd_restante if qtd > 0 else 0
+                else:
+                    qtd_short += qtd
+                    receita_short += receita_com_taxas
+            if fim_de_mes[i]:
+                pos_estado.append(posicoes[i])
+                estados.append((qtd_long, custo_long, qtd_short, receita_short))
+
+    # Volta à ordem das operações, a mesma em que os eventos eram gerados linha a linha
+    ordem_eventos = np.argsort(pos_evento[:k], kind='stable')
+    pos_evento = pos_evento[:k][ordem_eventos]
+    eventos = pd.DataFrame({
+        'Ano-Mês': _ano_mes(df_outros['Data Pregao'].to_numpy()[pos_evento]),
+        'Categoria': df_outros['Categoria'].to_numpy()[pos_evento],
+        'Vendas Totais': vendas_evento[:k][ordem_eventos],
+        'Lucro Bruto': lucro_evento[:k][ordem_eventos],
+        'IRRF': irrf_evento[:k][ordem_eventos],
+    }, index=df_outros.index[pos_evento])
+
+    pos_estado = np.array(pos_estado, dtype=np.int64)
+    custodia = pd.DataFrame(estados, columns=COLUNAS_CUSTODIA[3:])
+    custodia.insert(0, 'Ano-Mês', _ano_mes(df_outros['Data Pregao'].to_numpy()[pos_estado]))
+    custodia.insert(1, 'Ativo', df_outros['Ativo'].to_numpy()[pos_estado])
+    custodia.insert(2, 'Categoria', df_outros['Categoria'].to_numpy()[pos_estado])
+    return eventos, custodia
+
+
+# --- Execução em paralelo ---
+# A custódia de cada (ativo, categoria) e cada série de opções são independentes:
+# as operações são divididas em partições por chave, processadas em um pool de
+# processos e os eventos parciais são reunidos antes do agrupamento mensal, na
+# mesma ordem da execução em um único processo (resultados idênticos).
 
+# Abaixo disso o custo de enviar as partições aos processos supera o ganho
+MIN_OPERACOES_POR_PROCESSO = 20000
+
+
+def _particoes_balanceadas(chaves: np.ndarray, n: int) -> list:
+    """
+    Distribui as chaves (códigos inteiros, um por operação) em até 'n' partições
+    com quantidades parecidas de operações. Retorna os índices posicionais de cada uma.
+    """
+    codigos, contagens = np.unique(chaves, return_counts=True)
+    cargas = [0] * n
+    destino = {}
+    for i in np.argsort(-contagens, kind='stable').tolist():
+        particao = cargas.index(min(cargas))
+        destino[codigos[i]] = particao
+        cargas[particao] += int(contagens[i])
+    particao_por_operacao = pd.Series(chaves).map(destino).to_numpy()
+    return [np.flatnonzero(particao_por_operacao == p) for p in range(n) if cargas[p]]
+
+
+def _particoes_por_faixa(chaves: np.ndarray, n: int) -> list:
+    """
+    Divide chaves ordenáveis em até 'n' faixas contíguas com quantidades parecidas
+    de operações: concatenar os resultados das faixas preserva a ordem do groupby.
+    """
+    ordem = np.argsort(chaves, kind='stable')
+    ordenadas = chaves[ordem]
+    alvos = (np.arange(1, n) * len(ordenadas)) // n
+    # Cada corte avança até o fim da sua chave, para que nenhuma chave fique dividida
+    cortes = np.unique(np.concatenate(([0], np.searchsorted(ordenadas, ordenadas[alvos], side='right'),
+                                       [len(ordenadas)])))
+    return [np.sort(ordem[i:j]) for i, j in zip(cortes[:-1], cortes[1:])]
+
+
+def _processar_outros_ativos_paralelo(df_outros: pd.DataFrame, processos: int) -> pd.DataFrame:
+    """'_processar_outros_ativos' com as chaves (ativo, categoria) divididas entre processos."""
+    df_outros = df_outros.reset_index(drop=True)
+    chaves = df_outros.groupby(['Ativo', 'Categoria'], sort=False, dropna=False).ngroup().to_numpy()
+    particoes = [df_outros.iloc[p] for p in _particoes_balanceadas(chaves, processos)]
+    if len(particoes) < 2:
+        return _processar_outros_ativos(df_outros)
+    with ProcessPoolExecutor(max_workers=len(particoes)) as executor:
+        parciais = list(executor.map(_processar_outros_ativos, particoes))
+    # O índice é a posição da operação que gerou o evento: volta à ordem original
+    eventos = pd.concat([e for e in parciais if not e.empty] or parciais[:1])
+    return eventos.sort_index(kind='stable')
+
+
+def _processar_opcoes_paralelo(df_opcoes: pd.DataFrame, data_apuracao: pd.Timestamp, processos: int) -> pd.DataFrame:
+    """'_processar_opcoes' com os ativos divididos em faixas entre processos."""
+    validas = df_opcoes['Ativo'].notna().to_numpy()
+    # Linhas sem ativo ficam fora de todos os grupos, como no groupby
+    df_opcoes = df_opcoes[validas]
+    if df_opcoes.empty:
+        return pd.DataFrame(columns=COLUNAS_EVENTOS)
+    codigos, _ = pd.factorize(df_opcoes['Ativo'], sort=True)
+    particoes = [df_opcoes.iloc[p] for p in _particoes_por_faixa(codigos, processos)]
+    if len(particoes) < 2:
+        return _processar_opcoes(df_opcoes, data_apuracao)
+    with ProcessPoolExecutor(max_workers=len(particoes)) as executor:
+        parciais = list(executor.map(_processar_opcoes, particoes, [data_apuracao] * len(particoes)))
+    return pd.concat([e for e in parciais if not e.empty] or parciais[:1], ignore_index=True)
+
+
+def _preparar_operacoes(df_operacoes: pd.DataFrame) -> pd.DataFrame:
+    """Operações normalizadas e classificadas, prontas para a apuração."""
+    df = _normalizar_operacoes(df_operacoes)
+
+    # --- 2. CLASSIFICAÇÃO DA CATEGORIA (com melhorias) ---
+    df['Categoria'] = _classificar_categorias(df)
+    return df
+
+
+def _normalizar_operacoes(df_operacoes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normaliza as operações para a apuração: datas, vencimentos, sentido (C/V) e
+    valores numéricos. As operações ficam em ordem cronológica (estável: no mesmo
+    pregão vale a ordem original), que é a ordem em que o preço médio é calculado.
+    """
     df = df_operacoes.copy()
 
     # --- 1. PREPARAÇÃO DOS DADOS ---
     if 'Ativo' not in df.columns:
         df.rename(columns={'Titulo': 'Ativo'}, inplace=True)
 
-    df['Data Pregao'] = pd.to_datetime(df['Data Pregao'], format='%d/%m/%Y', errors='coerce')
+    # Dados vindos do banco já chegam com 'Data Pregao' em datetime
+    if not pd.api.types.is_datetime64_any_dtype(df['Data Pregao']):
+        df['Data Pregao'] = pd.to_datetime(df['Data Pregao'], format='%d/%m/%Y', errors='coerce')
     
     if 'Vencimento' in df.columns:
-        df['Vencimento'] = df['Vencimento'].apply(_parse_vencimento_flex)
+        df['Vencimento'] = _parse_vencimento_serie(df['Vencimento'])
     else:
         df['Vencimento'] = pd.NaT
 
@@ -174,81 +440,107 @@ def calcular_ir(df_operacoes: pd.DataFrame, data_apuracao=None) -> pd.DataFrame:
     df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
     df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce')
     df.dropna(subset=['Valor', 'Quantidade', 'Operacao', 'Data Pregao'], inplace=True)
-    
-    # --- 2. CLASSIFICAÇÃO DA CATEGORIA (com melhorias) ---
-    def classificar_categoria(row):
-        tipo_mercado = str(row.get('Tipo Mercado', '')).upper()
-        ativo = str(row['Ativo']).upper()
-        operacoes_no_dia = df[(df['Ativo'] == row['Ativo']) & (df['Data Pregao'].dt.date == row['Data Pregao'].date)]
-        has_compra = 'C' in operacoes_no_dia['Operacao'].values
-        has_venda = 'V' in operacoes_no_dia['Operacao'].values
-        if has_compra and has_venda: 
-            return 'Day Trade'
-        if 'OPCAO' in tipo_mercado: 
-            return 'Opções Swing'
-        if 'FII' in ativo or 'FUNDO IMOB' in tipo_mercado: 
-            return 'Fundos Imobiliários'
-        if 'ETF' in ativo: 
-            return 'ETFs Swing'
-        if 'BDR' in ativo: 
-            return 'BDRs Swing'
-        if 'TERMO' in tipo_mercado: 
-            return 'Operações a Termo'
-        return 'Ações Swing'
-    df['Categoria'] = df.apply(classificar_categoria, axis=1)
+    df.sort_values('Data Pregao', kind='stable', inplace=True)
+    return df
+
+
+def _separar_opcoes(df: pd.DataFrame):
+    """(operações com opções, demais operações)."""
+    eh_opcao = df['Categoria'].str.contains("Opções")
+    return df[eh_opcao].copy(), df[~eh_opcao].copy()
+
+
+def _resumir_eventos(eventos: list) -> pd.DataFrame:
+    """Soma os eventos por (Ano-Mês, Categoria), em ordem de mês."""
+    eventos = [e for e in eventos if not e.empty]
+    if not eventos:
+        return pd.DataFrame(columns=COLUNAS_EVENTOS)
+    df_eventos = pd.concat(eventos, ignore_index=True)
+    df_resumo = df_eventos.groupby(['Ano-Mês', 'Categoria'], as_index=False).sum()
+    return df_resumo.sort_values('Ano-Mês').reset_index(drop=True)
+
+
+def calcular_ir(df_operacoes: pd.DataFrame, data_apuracao=None, processos: int = 1) -> pd.DataFrame:
+    """
+    Resumo mensal do IR por categoria. Com 'processos' > 1, históricos grandes
+    (a partir de MIN_OPERACOES_POR_PROCESSO operações por processo) têm a custódia
+    e as opções calculadas em paralelo, por chave.
+    """
+    if df_operacoes.empty:
+        return pd.DataFrame()
+
+    df = _preparar_operacoes(df_operacoes)
 
     # --- 3. SEPARAÇÃO E PROCESSAMENTO ---
     data_apuracao_ts = pd.to_datetime(data_apuracao) if data_apuracao else df['Data Pregao'].max()
-    df_opcoes = df[df['Categoria'].str.contains("Opções")].copy()
-    df_outros = df[~df['Categoria'].str.contains("Opções")].copy()
-    eventos_opcoes = _processar_opcoes(df_opcoes, data_apuracao_ts)
-    eventos_outros = _processar_outros_ativos(df_outros)
-    eventos = eventos_opcoes + eventos_outros
+    df_opcoes, df_outros = _separar_opcoes(df)
+    processos = min(processos, len(df) // MIN_OPERACOES_POR_PROCESSO)
+    if processos > 1:
+        eventos_opcoes = _processar_opcoes_paralelo(df_opcoes, data_apuracao_ts, processos)
+        eventos_outros = _processar_outros_ativos_paralelo(df_outros, processos)
+    else:
+        eventos_opcoes = _processar_opcoes(df_opcoes, data_apuracao_ts)
+        eventos_outros = _processar_outros_ativos(df_outros)
 
     # --- 4. CÁLCULO E AGRUPAMENTO FINAL DO IR ---
-    if not eventos:
+    df_resumo = _resumir_eventos([eventos_opcoes, eventos_outros])
+    if df_resumo.empty:
         return pd.DataFrame()
-    df_eventos = pd.DataFrame(eventos)
-    df_resumo = df_eventos.groupby(['Ano-Mês', 'Categoria'], as_index=False).sum()
-    df_resumo = df_resumo.sort_values('Ano-Mês').reset_index(drop=True)
-    df_resumo['Prejuízo Acumulado'] = 0.0
-    df_resumo['Lucro Líquido'] = 0.0
-    df_resumo['IR a Pagar'] = 0.0
-    df_resumo['DARF Acumulada'] = 0.0
-    prejuizo_acumulado = defaultdict(float)
-    darf_acumulada = defaultdict(float)
-    for idx, row in df_resumo.iterrows():
-        cat = row['Categoria']
-        lucro_bruto_mes = row['Lucro Bruto']
-        lucro_com_prejuizo_abatido = lucro_bruto_mes - prejuizo_acumulado[cat]
-        prejuizo_acumulado[cat] = 0
-        lucro_liquido_mes = 0.0
-        if lucro_com_prejuizo_abatido < 0:
-            prejuizo_acumulado[cat] = abs(lucro_com_prejuizo_abatido)
-        else:
-            lucro_liquido_mes = lucro_com_prejuizo_abatido
-        df_resumo.at[idx, 'Lucro Líquido'] = lucro_liquido_mes
-        df_resumo.at[idx, 'Prejuízo Acumulado'] = -prejuizo_acumulado[cat]
-        ir_bruto = 0.0
-        irrf_retido = row.get('IRRF', 0.0)  # Deduz IRRF retido
-        if lucro_liquido_mes > 0:
-            if cat in ['Ações Swing', 'ETFs Swing', 'BDRs Swing', 'Operações a Termo']:
-                vendas_mes = df_eventos[(df_eventos['Ano-Mês'] == row['Ano-Mês']) & (df_eventos['Categoria'] == cat)]['Vendas Totais'].sum()
-                if vendas_mes > 20000:
-                    ir_bruto = round(lucro_liquido_mes * 0.15, 2)
-            elif cat == 'Day Trade':
-                ir_bruto = round(lucro_liquido_mes * 0.20, 2)
-            elif cat == 'Opções Swing':
-                ir_bruto = round(lucro_liquido_mes * 0.15, 2)
-            elif cat == 'Fundos Imobiliários':
-                ir_bruto = round(lucro_liquido_mes * 0.20, 2)
-        ir = max(0, ir_bruto - irrf_retido)
-        darf_acumulada[cat] += ir
-        ir_pagar = 0.0
-        if darf_acumulada[cat] >= 10.0:
-            ir_pagar = round(darf_acumulada[cat], 2)
-            darf_acumulada[cat] = 0.0
-        df_resumo.at[idx, 'IR a Pagar'] = ir_pagar
-        df_resumo.at[idx, 'DARF Acumulada'] = round(darf_acumulada[cat], 2)
-
+    _apurar_meses(df_resumo)
     return df_resumo
+
+
+def _apurar_meses(df_resumo: pd.DataFrame, estado_inicial: dict = None) -> np.ndarray:
+    """
+    Compensação de prejuízos e acúmulo de DARF mês a mês, por categoria.
+    'df_resumo' tem uma linha por (Ano-Mês, Categoria), já ordenada por mês; as
+    vendas do mês usadas na isenção são as da própria linha (soma do groupby).
+    Cada categoria é percorrida uma vez sobre arrays e as colunas são gravadas
+    inteiras em 'df_resumo'.
+
+    'estado_inicial' ({categoria: (prejuízo a compensar, DARF pendente)}) permite
+    continuar a apuração de um mês já fechado. Retorna a DARF pendente, sem
+    arredondamento, após cada linha.
+    """
+    n = len(df_resumo)
+    lucro_liquido = np.zeros(n)
+    prejuizo = np.zeros(n)
+    ir_a_pagar = np.zeros(n)
+    darf = np.zeros(n)
+    darf_pendente = np.zeros(n)
+    estado_inicial = estado_inicial or {}
+
+    lucros = df_resumo['Lucro Bruto'].to_numpy(dtype=float)
+    vendas = df_resumo['Vendas Totais'].to_numpy(dtype=float)
+    irrf = df_resumo['IRRF'].to_numpy(dtype=float) if 'IRRF' in df_resumo.columns else np.zeros(n)
+
+    for cat, linhas in df_resumo.groupby('Categoria', sort=False).indices.items():
+        aliquota = ALIQUOTAS_IR.get(cat, 0.0)
+        isencao = cat in CATEGORIAS_ISENCAO
+        prejuizo_acumulado, darf_acumulada = estado_inicial.get(cat, (0.0, 0.0))
+        for i in linhas.tolist():
+            lucro_com_prejuizo_abatido = lucros[i] - prejuizo_acumulado
+            prejuizo_acumulado = 0.0
+            lucro_liquido_mes = 0.0
+            if lucro_com_prejuizo_abatido < 0:
+                prejuizo_acumulado = abs(lucro_com_prejuizo_abatido)
+            else:
+                lucro_liquido_mes = lucro_com_prejuizo_abatido
+            lucro_liquido[i] = lucro_liquido_mes
+            prejuizo[i] = -prejuizo_acumulado
+
+            ir_bruto = 0.0
+            if lucro_liquido_mes > 0 and (not isencao or vendas[i] > LIMITE_ISENCAO):
+                ir_bruto = round(lucro_liquido_mes * aliquota, 2)
+            darf_acumulada += max(0, ir_bruto - irrf[i])  # Deduz IRRF retido
+            if darf_acumulada >= VALOR_MINIMO_DARF:
+                ir_a_pagar[i] = round(darf_acumulada, 2)
+                darf_acumulada = 0.0
+            darf[i] = round(darf_acumulada, 2)
+            darf_pendente[i] = darf_acumulada
+
+    df_resumo['Prejuízo Acumulado'] = prejuizo
+    df_resumo['Lucro Líquido'] = lucro_liquido
+    df_resumo['IR a Pagar'] = ir_a_pagar
+    df_resumo['DARF Acumulada'] = darf
+    return darf_pendente
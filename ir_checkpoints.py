@@ -0,0 +1,295 @@
+# ir_checkpoints.py
+# Apuração incremental do IR. Ao fim de cada mês ficam gravados (SQLite local):
+# - a custódia de cada (ativo, categoria) que operou no mês e uma impressão digital
+#   das operações do mês, junto com os eventos realizados (sem opções);
+# - o resumo mensal e, por categoria, o prejuízo a compensar e a DARF pendente.
+# Um novo cálculo recomeça do primeiro mês cujas operações mudaram, a partir da
+# custódia do mês anterior; a compensação de prejuízos recomeça do primeiro mês
+# cujo resumo mudou. Incluir as notas do mês corrente custa o mês corrente.
+#
+# Os checkpoints são apenas um cache: apagar o arquivo só força o cálculo completo.
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import ir_calculator as irc
+import migracoes
+
+CAMINHO_CHECKPOINTS = "checkpoints_ir.db"
+# Incrementar quando o formato mudar: os checkpoints são descartados e recalculados
+VERSAO_CHECKPOINTS = 1
+
+# Colunas das operações que entram na impressão digital de cada mês
+COLUNAS_IMPRESSAO = ['Data Pregao', 'Ativo', 'Categoria', 'Operacao', 'Quantidade', 'Valor', 'Taxas']
+
+# Colunas do resultado de 'calcular_ir'
+COLUNAS_RESUMO = irc.COLUNAS_EVENTOS + ['Prejuízo Acumulado', 'Lucro Líquido', 'IR a Pagar', 'DARF Acumulada']
+
+_lock = threading.Lock()
+
+
+def _conectar(caminho: str) -> sqlite3.Connection:
+    return migracoes.conectar_cache_versionado(caminho, VERSAO_CHECKPOINTS, """
+        CREATE TABLE IF NOT EXISTS meses_operacoes (
+            conta TEXT, mes TEXT, impressao TEXT, eventos TEXT,
+            PRIMARY KEY (conta, mes)
+        );
+        CREATE TABLE IF NOT EXISTS custodia (
+            conta TEXT, mes TEXT, ativo TEXT, categoria TEXT,
+            qtd_comprada REAL, custo_comprado REAL, qtd_vendida REAL, receita_vendida REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_custodia_conta_mes ON custodia (conta, mes);
+        CREATE TABLE IF NOT EXISTS meses_apuracao (
+            conta TEXT, mes TEXT, impressao TEXT, linhas TEXT, estado TEXT,
+            PRIMARY KEY (conta, mes)
+        );
+    """)
+
+
+def _impressoes_por_mes(df: pd.DataFrame, colunas: list) -> dict:
+    """
+    {Ano-Mês: impressão digital} das linhas de 'df' (em ordem de mês). A posição
+    da linha dentro do mês entra no hash, pois a ordem das operações altera o preço médio.
+    """
+    if df.empty:
+        return {}
+    meses = df['Ano-Mês'].to_numpy()
+    inicios = np.flatnonzero(np.append(True, meses[1:] != meses[:-1]))
+    posicao = np.arange(len(df)) - np.repeat(inicios, np.diff(np.append(inicios, len(df))))
+    dados = df[[c for c in colunas if c in df.columns]].assign(_posicao=posicao)
+    hashes = pd.util.hash_pandas_object(dados, index=False).to_numpy()
+    somas = np.add.reduceat(hashes, inicios)
+    return {mes: f"{int(h):016x}" for mes, h in zip(meses[inicios], somas)}
+
+
+def _primeiro_mes_alterado(atuais: dict, gravadas: dict):
+    """Primeiro mês (em ordem) com impressão diferente, novo ou removido; None se nada mudou."""
+    for mes in sorted(set(atuais) | set(gravadas)):
+        if atuais.get(mes) != gravadas.get(mes):
+            return mes
+    return None
+
+
+def _custodia_ate(conn: sqlite3.Connection, conta: str, mes: str) -> dict:
+    """Custódia de cada (ativo, categoria) no último checkpoint anterior a 'mes'."""
+    linhas = conn.execute("""
+        SELECT ativo, categoria, qtd_comprada, custo_comprado, qtd_vendida, receita_vendida
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY ativo, categoria ORDER BY mes DESC) AS ordem
+            FROM custodia WHERE conta = ? AND mes < ?
+        )
+        WHERE ordem = 1
+    """, (conta, mes)).fetchall()
+    return {irc._chave_custodia(ativo, categoria): tuple(valores) for ativo, categoria, *valores in linhas}
+
+
+def _eventos_outros(conn: sqlite3.Connection, conta: str, df_outros: pd.DataFrame) -> pd.DataFrame:
+    """
+    Eventos realizados (sem opções) somados por mês, reaproveitando os meses cujas
+    operações não mudaram e recalculando a custódia a partir do primeiro mês alterado.
+    """
+    df_outros = df_outros.assign(**{'Ano-Mês': irc._ano_mes(df_outros['Data Pregao'])})
+    atuais = _impressoes_por_mes(df_outros, COLUNAS_IMPRESSAO)
+    gravados = dict(conn.execute(
+        "SELECT mes, impressao FROM meses_operacoes WHERE conta = ?", (conta,)
+    ).fetchall())
+    inicio = _primeiro_mes_alterado(atuais, gravados)
+
+    if inicio is None:
+        reaproveitados = conn.execute(
+            "SELECT eventos FROM meses_operacoes WHERE conta = ? ORDER BY mes", (conta,)
+        ).fetchall()
+        novos = pd.DataFrame(columns=irc.COLUNAS_EVENTOS)
+    else:
+        reaproveitados = conn.execute(
+            "SELECT eventos FROM meses_operacoes WHERE conta = ? AND mes < ? ORDER BY mes", (conta, inicio)
+        ).fetchall()
+        eventos, custodia = irc._percorrer_custodia(
+            df_outros[df_outros['Ano-Mês'] >= inicio].drop(columns='Ano-Mês'),
+            _custodia_ate(conn, conta, inicio),
+        )
+        novos = irc._resumir_eventos([eventos])
+
+        conn.execute("DELETE FROM meses_operacoes WHERE conta = ? AND mes >= ?", (conta, inicio))
+        conn.execute("DELETE FROM custodia WHERE conta = ? AND mes >= ?", (conta, inicio))
+        por_mes = {mes: grupo for mes, grupo in novos.groupby('Ano-Mês')}
+        conn.executemany(
+            "INSERT INTO meses_operacoes (conta, mes, impressao, eventos) VALUES (?, ?, ?, ?)",
+            [
+                (conta, mes, impressao, json.dumps(por_mes[mes].values.tolist() if mes in por_mes else []))
+                for mes, impressao in atuais.items() if mes >= inicio
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO custodia VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(conta, mes, None if pd.isna(ativo) else ativo, categoria, *valores)
+             for mes, ativo, categoria, *valores in custodia.itertuples(index=False)],
+        )
+
+    linhas = [linha for (eventos,) in reaproveitados for linha in json.loads(eventos)]
+    anteriores = pd.DataFrame(linhas, columns=irc.COLUNAS_EVENTOS)
+    return pd.concat([e for e in (anteriores, novos) if not e.empty] or [anteriores], ignore_index=True)
+
+
+def _apurar_incremental(conn: sqlite3.Connection, conta: str, df_resumo: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compensação de prejuízos e DARF a partir do primeiro mês cujo resumo mudou,
+    continuando do estado gravado ao fim do mês anterior.
+    """
+    atuais = _impressoes_por_mes(df_resumo, irc.COLUNAS_EVENTOS)
+    gravados = dict(conn.execute(
+        "SELECT mes, impressao FROM meses_apuracao WHERE conta = ?", (conta,)
+    ).fetchall())
+    inicio = _primeiro_mes_alterado(atuais, gravados)
+    if inicio is None:
+        inicio = max(atuais, default="") + "~"  # Depois de todos os meses: nada a recalcular
+
+    anteriores = conn.execute(
+        "SELECT linhas, estado FROM meses_apuracao WHERE conta = ? AND mes < ? ORDER BY mes", (conta, inicio)
+    ).fetchall()
+    estado = {cat: tuple(v) for cat, v in json.loads(anteriores[-1][1]).items()} if anteriores else {}
+
+    novos = df_resumo[df_resumo['Ano-Mês'] >= inicio].reset_index(drop=True)
+    if not novos.empty:
+        darf_pendente = irc._apurar_meses(novos, estado)
+        # Estado de cada categoria ao fim de cada mês recalculado
+        registros = []
+        for mes, linhas in novos.groupby('Ano-Mês', sort=True).indices.items():
+            for i in linhas:
+                estado[novos.at[i, 'Categoria']] = (-novos.at[i, 'Prejuízo Acumulado'], darf_pendente[i])
+            registros.append((conta, mes, atuais[mes],
+                              json.dumps(novos.iloc[linhas].to_dict('records'), ensure_ascii=False),
+                              json.dumps(estado, ensure_ascii=False)))
+        conn.execute("DELETE FROM meses_apuracao WHERE conta = ? AND mes >= ?", (conta, inicio))
+        conn.executemany("INSERT INTO meses_apuracao VALUES (?, ?, ?, ?, ?)", registros)
+
+    linhas = [linha for (registro, _) in anteriores for linha in json.loads(registro)]
+    reaproveitados = pd.DataFrame(linhas, columns=COLUNAS_RESUMO)
+    return pd.concat([r for r in (reaproveitados, novos) if not r.empty], ignore_index=True)
+
+
+def _etapas_independentes_da_apuracao(df_operacoes: pd.DataFrame, conta: str, caminho: str):
+    """
+    Etapas que não dependem da data de apuração: preparação, separação das opções
+    e eventos das demais operações (via checkpoints).
+    Retorna (operações com opções, eventos sem opções, data do último pregão).
+    """
+    df = irc._preparar_operacoes(df_operacoes)
+    df_opcoes, df_outros = irc._separar_opcoes(df)
+    with _lock, _conectar(caminho) as conn:
+        eventos_outros = _eventos_outros(conn, conta, df_outros)
+    return df_opcoes, eventos_outros, df['Data Pregao'].max()
+
+
+def _apurar(df_opcoes: pd.DataFrame, eventos_outros: pd.DataFrame, data_apuracao_ts: pd.Timestamp,
+            conta: str, caminho: str) -> pd.DataFrame:
+    """Eventos de opções até a data de apuração e compensação mês a mês."""
+    eventos_opcoes = irc._processar_opcoes(df_opcoes, data_apuracao_ts)
+    df_resumo = irc._resumir_eventos([eventos_opcoes, eventos_outros])
+    with _lock, _conectar(caminho) as conn:
+        if df_resumo.empty:
+            conn.execute("DELETE FROM meses_apuracao WHERE conta = ?", (conta,))
+            return pd.DataFrame()
+        return _apurar_incremental(conn, conta, df_resumo)
+
+
+def calcular_ir_incremental(df_operacoes: pd.DataFrame, data_apuracao=None, conta: str = "padrao",
+                            caminho: str = CAMINHO_CHECKPOINTS) -> pd.DataFrame:
+    """
+    Mesmo resultado de 'ir_calculator.calcular_ir', reaproveitando os checkpoints
+    mensais gravados para 'conta' em 'caminho'. Opções dependem da data de apuração
+    (vencimentos) e são sempre recalculadas.
+    """
+    if df_operacoes.empty:
+        return pd.DataFrame()
+
+    df_opcoes, eventos_outros, ultimo_pregao = _etapas_independentes_da_apuracao(df_operacoes, conta, caminho)
+    data_apuracao_ts = pd.to_datetime(data_apuracao) if data_apuracao else ultimo_pregao
+    return _apurar(df_opcoes, eventos_outros, data_apuracao_ts, conta, caminho)
+
+
+# --- Cache em memória dos resultados ---
+# Evita refazer o cálculo a cada rerun do Streamlit. A chave é a versão do conjunto
+# de dados ('database.versao_colecao'), quando o chamador a conhece; senão, uma
+# impressão digital barata das operações (quantidade de linhas e hash do
+# conteúdo). As opções só comparam o mês do vencimento com o mês da apuração,
+# então o resultado é guardado por mês de apuração: mudar o dia dentro do mesmo
+# mês reaproveita tudo, e mudar o mês refaz só as opções e a compensação a partir
+# do primeiro mês alterado.
+
+MAX_RESULTADOS_EM_CACHE = 16
+
+# (conta, impressão ou versão) -> (operações com opções, eventos sem opções, último pregão)
+_etapas_em_cache = OrderedDict()
+# (conta, impressão ou versão, mês de apuração) -> resumo do IR
+_resultados_em_cache = OrderedDict()
+_lock_cache = threading.Lock()
+
+
+def impressao_operacoes(df_operacoes: pd.DataFrame) -> tuple:
+    """Impressão digital das operações: (linhas, hash do conteúdo)."""
+    hashes = pd.util.hash_pandas_object(df_operacoes, index=False).to_numpy()
+    return len(df_operacoes), hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+def _obter_do_cache(cache: OrderedDict, chave):
+    with _lock_cache:
+        valor = cache.get(chave)
+        if valor is not None:
+            cache.move_to_end(chave)
+        return valor
+
+
+def _guardar_no_cache(cache: OrderedDict, chave, valor):
+    with _lock_cache:
+        cache[chave] = valor
+        cache.move_to_end(chave)
+        while len(cache) > MAX_RESULTADOS_EM_CACHE:
+            cache.popitem(last=False)
+
+
+def calcular_ir_em_cache(df_operacoes: pd.DataFrame, data_apuracao=None, conta: str = "padrao",
+                         caminho: str = CAMINHO_CHECKPOINTS, versao=None) -> pd.DataFrame:
+    """
+    'calcular_ir_incremental' com os resultados guardados em memória (LRU de
+    MAX_RESULTADOS_EM_CACHE entradas). 'versao' é o token da versão das operações
+    ('database.versao_colecao'): quando informado, é a chave do cache e as operações
+    não são lidas em um acerto. Sem ele, a chave é 'impressao_operacoes'.
+    O resultado é compartilhado entre as chamadas: deve ser tratado como somente leitura.
+    """
+    if df_operacoes.empty:
+        return pd.DataFrame()
+
+    impressao = ('versao', versao) if versao is not None else impressao_operacoes(df_operacoes)
+    mes_apuracao = pd.Timestamp(data_apuracao).strftime('%Y-%m') if data_apuracao else None
+    chave_resultado = (conta, impressao, mes_apuracao)
+    resultado = _obter_do_cache(_resultados_em_cache, chave_resultado)
+    if resultado is None:
+        etapas = _obter_do_cache(_etapas_em_cache, (conta, impressao))
+        if etapas is None:
+            etapas = _etapas_independentes_da_apuracao(df_operacoes, conta, caminho)
+            _guardar_no_cache(_etapas_em_cache, (conta, impressao), etapas)
+        df_opcoes, eventos_outros, ultimo_pregao = etapas
+        data_apuracao_ts = pd.to_datetime(data_apuracao) if data_apuracao else ultimo_pregao
+        resultado = _apurar(df_opcoes, eventos_outros, data_apuracao_ts, conta, caminho)
+        _guardar_no_cache(_resultados_em_cache, chave_resultado, resultado)
+    return resultado
+
+
+def descartar_checkpoints(conta: str = None, caminho: str = CAMINHO_CHECKPOINTS):
+    """Apaga os checkpoints de uma conta (ou de todas): o próximo cálculo será completo."""
+    with _lock, _conectar(caminho) as conn:
+        for tabela in ("meses_operacoes", "custodia", "meses_apuracao"):
+            if conta is None:
+                conn.execute(f"DELETE FROM {tabela}")
+            else:
+                conn.execute(f"DELETE FROM {tabela} WHERE conta = ?", (conta,))
+    with _lock_cache:
+        _etapas_em_cache.clear()
+        _resultados_em_cache.clear()
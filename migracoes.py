@@ -0,0 +1,165 @@
+# migracoes.py
+# Migrações versionadas do banco SQLite local (notas_corretagem.db).
+# A versão aplicada fica na tabela 'schema_versao'. Cada migração roda em uma única
+# transação, junto com o registro da sua versão: se for interrompida, nada é
+# gravado e ela é refeita do início na próxima execução.
+#
+#   python migracoes.py [caminho_do_banco]
+#
+# Para criar uma migração, escreva a função e acrescente-a ao final de MIGRACOES.
+# Prefira SQL sobre o conjunto (UPDATE ... CASE) a laços linha a linha.
+
+import datetime
+import sqlite3
+import sys
+
+DB_PATH = "notas_corretagem.db"
+
+# Índices criados pela migração 3: chave da nota e data do pregão
+INDICES = {
+    "notas_cabecalho": [("numero_nota",), ("data_pregao",)],
+    "operacoes": [("Numero Nota",), ("Data Pregao",)],
+    "resumos_negocios": [("Numero Nota",), ("Data Pregao",)],
+    "resumos_financeiros": [("Numero Nota",), ("Data Pregao",)],
+}
+
+
+def _colunas_da_tabela(conn: sqlite3.Connection, tabela: str) -> set:
+    return {linha[1] for linha in conn.execute(f'PRAGMA table_info("{tabela}")')}
+
+
+def _m001_esquema_inicial(conn: sqlite3.Connection):
+    """Cria as tabelas que ainda não existem, no formato gravado pelo app."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notas_cabecalho (
+            numero_nota TEXT, folha TEXT, data_pregao TEXT, corretora TEXT, cnpj TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS operacoes (
+            "Numero Nota" TEXT, "Data Pregao" TEXT, "Corretora" TEXT, "CNPJ" TEXT,
+            "Negociacao" TEXT, "Tipo Mercado" TEXT, "Vencimento" TEXT, "Titulo" TEXT,
+            "Obs" TEXT, "Quantidade" INTEGER, "Preço" REAL, "Valor" REAL, "D/C" TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS resumos_negocios (
+            "Campo" TEXT, "Valor" TEXT, "Numero Nota" TEXT, "Data Pregao" TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS resumos_financeiros (
+            "Campo" TEXT, "Valor" TEXT, "D/C" TEXT, "Numero Nota" TEXT, "Data Pregao" TEXT
+        )
+    """)
+
+
+def _m002_compra_venda(conn: sqlite3.Connection):
+    """
+    Cria e preenche a coluna CompraVenda de 'operacoes' (antigo uptade_compra_venda.py).
+    Negociação (ou, se vazia, Obs) com 'LISTADV' indica venda; caso contrário usa 'D/C'.
+    Linhas que já têm CompraVenda não são alteradas.
+    """
+    colunas = _colunas_da_tabela(conn, "operacoes")
+    if "CompraVenda" not in colunas:
+        conn.execute("ALTER TABLE operacoes ADD COLUMN CompraVenda TEXT")
+
+    origens = [f"NULLIF(\"{c}\", '')" for c in ("Negociacao", "Obs") if c in colunas]
+    texto = f"COALESCE({', '.join(origens)}, '')" if origens else "''"
+    conn.execute(f"""
+        UPDATE operacoes
+        SET CompraVenda = CASE WHEN UPPER({texto}) LIKE '%LISTADV%' THEN 'V' ELSE "D/C" END
+        WHERE CompraVenda IS NULL OR CompraVenda = ''
+    """)
+
+
+def _m003_indices(conn: sqlite3.Connection):
+    """Índices na chave da nota e na data do pregão de cada tabela."""
+    for tabela, indices in INDICES.items():
+        colunas_existentes = _colunas_da_tabela(conn, tabela)
+        for colunas in indices:
+            if not set(colunas) <= colunas_existentes:
+                continue
+            nome = "idx_" + tabela + "_" + "_".join(c.lower().replace(" ", "_") for c in colunas)
+            lista = ", ".join(f'"{c}"' for c in colunas)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{nome}" ON "{tabela}" ({lista})')
+
+
+# (versão, descrição, função) em ordem crescente de versão
+MIGRACOES = [
+    (1, "Esquema inicial", _m001_esquema_inicial),
+    (2, "Coluna CompraVenda em operacoes", _m002_compra_venda),
+    (3, "Índices de chave da nota e data do pregão", _m003_indices),
+]
+
+
+def versao_atual(conn: sqlite3.Connection) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_versao (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT,
+            aplicada_em TEXT
+        )
+    """)
+    conn.commit()
+    return conn.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao").fetchone()[0]
+
+
+def aplicar_migracoes(conn: sqlite3.Connection) -> list:
+    """Aplica, em ordem, as migrações pendentes. Retorna as versões aplicadas."""
+    aplicadas = []
+    atual = versao_atual(conn)
+    for versao, descricao, migracao in MIGRACOES:
+        if versao <= atual:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migracao(conn)
+            conn.execute(
+                "INSERT INTO schema_versao (versao, descricao, aplicada_em) VALUES (?, ?, ?)",
+                (versao, descricao, datetime.datetime.now().isoformat(timespec='seconds')),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(versao)
+    return aplicadas
+
+
+# --- Caches locais descartáveis ---
+# Arquivos que só guardam dados recalculáveis (espelho_local.py, ir_checkpoints.py)
+# não migram: quando o formato muda, as tabelas são apagadas e recriadas vazias.
+
+def conectar_cache_versionado(caminho: str, versao: int, esquema: str) -> sqlite3.Connection:
+    """
+    Abre um cache SQLite. Se a versão gravada (PRAGMA user_version) for diferente de
+    'versao', apaga todas as tabelas e grava a versão nova; em seguida executa
+    'esquema' (script com CREATE ... IF NOT EXISTS).
+    """
+    conn = sqlite3.connect(caminho, timeout=30)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != versao:
+        with conn:
+            tabelas = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+            for (tabela,) in tabelas:
+                conn.execute(f'DROP TABLE "{tabela}"')
+            conn.execute(f"PRAGMA user_version = {int(versao)}")
+    conn.executescript(esquema)
+    return conn
+
+
+def main():
+    caminho = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = sqlite3.connect(caminho)
+    try:
+        aplicadas = aplicar_migracoes(conn)
+    finally:
+        conn.close()
+    if aplicadas:
+        print(f"Migrações aplicadas em '{caminho}': {', '.join(map(str, aplicadas))}")
+    else:
+        print(f"Banco '{caminho}' já está na versão mais recente.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# normalizacao_ativos.py
+# Padronização dos nomes de ativos ('Titulo') pelo arquivo ativo_mapeamento.csv,
+# que associa o nome da especificação na nota ("FII SUNO EL CI ER", "SID NACIONAL
+# ON") ao código de negociação (SNEL11, CSNA3). Sem ela, o mesmo ativo aparece com
+# nomes diferentes e a posição e o IR o tratam como ativos distintos.
+#
+# A busca, em ordem:
+#   1. nome exato (ignorando maiúsculas e espaços repetidos);
+#   2. o maior nome mapeado que seja prefixo do título em palavras inteiras, para
+#      as marcações que as notas acrescentam ("SID NACIONAL ON NM", "... ER #");
+#   3. o mesmo nome sem pontuação ("SID. NACIONAL ON").
+# Títulos sem correspondência ficam como estão. O nome da nota é preservado em
+# 'Titulo Original': a classificação do IR (FII, ETF, BDR) depende dele, e é dele
+# que a padronização parte quando o arquivo de mapeamento muda.
+#
+# Aplicada na ingestão e na leitura do histórico. Para regravar as operações já
+# salvas (por exemplo, depois de incluir nomes no arquivo):
+#   python normalizacao_ativos.py
+
+import functools
+import os
+import re
+
+import pandas as pd
+
+CAMINHO_MAPEAMENTO = "ativo_mapeamento.csv"
+COLUNA_ORIGINAL = "Nome Original"
+COLUNA_PADRONIZADA = "Nome Padronizado"
+# Coluna das operações com o nome do ativo como veio da nota
+COLUNA_TITULO_ORIGINAL = "Titulo Original"
+
+_ESPACOS = re.compile(r"\s+")
+_PONTUACAO = re.compile(r"[^\w\s]")
+
+
+def _chave(nome: str) -> str:
+    return _ESPACOS.sub(" ", nome).strip().upper()
+
+
+def _chave_sem_pontuacao(nome: str) -> str:
+    return _chave(_PONTUACAO.sub(" ", nome))
+
+
+@functools.lru_cache(maxsize=None)
+def carregar_mapeamento(caminho: str = CAMINHO_MAPEAMENTO) -> tuple:
+    """
+    Lê o arquivo de mapeamento uma única vez e monta as tabelas de busca:
+    (nome exato -> código, nome sem pontuação -> código, maior número de palavras).
+    Arquivo ausente ou mal formatado resulta em tabelas vazias.
+    """
+    if not os.path.exists(caminho) or os.path.getsize(caminho) == 0:
+        return {}, {}, 0
+    try:
+        df = pd.read_csv(caminho, sep=';', dtype=str, encoding='utf-8')
+    except Exception as e:
+        print(f"Erro ao ler '{caminho}': {e}")
+        return {}, {}, 0
+    if COLUNA_ORIGINAL not in df.columns or COLUNA_PADRONIZADA not in df.columns:
+        print(f"O arquivo '{caminho}' não tem as colunas '{COLUNA_ORIGINAL}' e '{COLUNA_PADRONIZADA}'.")
+        return {}, {}, 0
+
+    df = df.dropna(subset=[COLUNA_ORIGINAL, COLUNA_PADRONIZADA])
+    exatos, sem_pontuacao = {}, {}
+    # Nomes repetidos: vale a primeira linha do arquivo
+    for original, padronizado in zip(df[COLUNA_ORIGINAL], df[COLUNA_PADRONIZADA]):
+        padronizado = padronizado.strip()
+        if _chave(original):
+            exatos.setdefault(_chave(original), padronizado)
+        if _chave_sem_pontuacao(original):
+            sem_pontuacao.setdefault(_chave_sem_pontuacao(original), padronizado)
+    max_palavras = max((chave.count(" ") + 1 for chave in exatos), default=0)
+    return exatos, sem_pontuacao, max_palavras
+
+
+def _buscar(titulo: str, exatos: dict, sem_pontuacao: dict, max_palavras: int) -> str:
+    """Código do ativo para um título, ou o próprio título se não houver correspondência."""
+    for chave, tabela in ((_chave(titulo), exatos), (_chave_sem_pontuacao(titulo), sem_pontuacao)):
+        if chave in tabela:
+            return tabela[chave]
+        palavras = chave.split(" ")
+        for tamanho in range(min(len(palavras) - 1, max_palavras), 0, -1):
+            prefixo = " ".join(palavras[:tamanho])
+            if prefixo in tabela:
+                return tabela[prefixo]
+    return titulo
+
+
+def normalizar_titulos(titulos: pd.Series, caminho: str = CAMINHO_MAPEAMENTO) -> pd.Series:
+    """
+    Série com os títulos padronizados (mesmo índice). Cada título distinto é
+    buscado uma única vez; valores ausentes e não textuais ficam como estão.
+    """
+    exatos, sem_pontuacao, max_palavras = carregar_mapeamento(caminho)
+    if not exatos or titulos.empty:
+        return titulos
+    codigos, unicos = pd.factorize(titulos)
+    convertidos = pd.Index([
+        _buscar(t, exatos, sem_pontuacao, max_palavras) if isinstance(t, str) else t for t in unicos
+    ], dtype=object)
+    resultado = pd.Series(convertidos.take(codigos), index=titulos.index, dtype=object, name=titulos.name)
+    # Ausentes (código -1 do factorize) continuam ausentes
+    return resultado.where(codigos >= 0, titulos).astype(titulos.dtype)
+
+
+def normalizar_operacoes(df: pd.DataFrame, coluna: str = "Titulo", caminho: str = CAMINHO_MAPEAMENTO) -> pd.DataFrame:
+    """
+    Aplica 'normalizar_titulos' à coluna do ativo, se existir (altera e retorna o
+    DataFrame). O nome da nota vai para COLUNA_TITULO_ORIGINAL, quando ainda não
+    está lá, e é a partir dele que o ativo é padronizado.
+    """
+    if coluna not in df.columns:
+        return df
+    if COLUNA_TITULO_ORIGINAL in df.columns:
+        df[COLUNA_TITULO_ORIGINAL] = df[COLUNA_TITULO_ORIGINAL].fillna(df[coluna])
+    else:
+        df[COLUNA_TITULO_ORIGINAL] = df[coluna]
+    df[coluna] = normalizar_titulos(df[COLUNA_TITULO_ORIGINAL], caminho)
+    return df
+
+
+if __name__ == "__main__":
+    from database import renormalizar_ativos
+
+    total = renormalizar_ativos()
+    print(f"Operações com o ativo padronizado: {total}.")
@@ -0,0 +1,221 @@
+# posicoes.py
+# Posição em custódia de cada ativo (quantidade, preço médio e custo), calculada a
+# partir das operações pelo preço médio, com posições compradas e vendidas.
+# Usada pela aba "Meus Ativos" do app.py.
+
+import numpy as np
+import pandas as pd
+
+from utils import converter_data_pregao
+
+COLUNAS_POSICAO_FINAL = [
+    'Corretora', 'Ativo', 'Tipo Mercado', 'Vencimento', 'Quantidade Custódia',
+    'Preço Médio Compra', 'Custo Total', 'Última Data Pregão'
+]
+
+# Estado de um ativo: [qtd comprada, custo, qtd vendida, receita, última data,
+#                      corretora, tipo de mercado, vencimento]
+_QTD_LONG, _CUSTO_LONG, _QTD_SHORT, _RECEITA_SHORT, _ULTIMA_DATA, _CORRETORA, _TIPO_MERCADO, _VENCIMENTO = range(8)
+
+
+def _preparar_operacoes(df_operacoes: pd.DataFrame) -> pd.DataFrame:
+    """Normaliza as operações e as coloca em ordem cronológica (estável)."""
+    df = df_operacoes.copy()
+    if 'Ativo' not in df.columns:
+        df.rename(columns={'Titulo': 'Ativo'}, inplace=True)
+    if 'Vencimento' not in df.columns:
+        df['Vencimento'] = ""
+    df['Data Pregao'] = converter_data_pregao(df['Data Pregao'])
+    if 'CompraVenda' in df.columns and not df['CompraVenda'].isnull().all():
+        df['Operacao'] = df['CompraVenda']
+    else:
+        df['Operacao'] = df['D/C'].map({'D': 'C', 'C': 'V'})
+    df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
+    df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce')
+    df.dropna(subset=['Valor', 'Quantidade', 'Operacao', 'Ativo'], inplace=True)
+    return df.sort_values(by='Data Pregao', kind='stable')
+
+
+def _percorrer_operacoes(df: pd.DataFrame, estado: dict = None) -> dict:
+    """
+    Aplica as operações (já preparadas e em ordem cronológica) ao estado de cada
+    ativo e retorna o estado atualizado ({ativo: lista _QTD_LONG..._VENCIMENTO}, na
+    ordem da primeira operação de cada ativo).
+    As operações são agrupadas por ativo uma única vez e cada ativo é percorrido
+    sobre arrays contíguos. Corretora, tipo de mercado e vencimento vêm da primeira
+    operação do ativo com corretora preenchida.
+    """
+    estado = {} if estado is None else estado
+    if df.empty:
+        return estado
+
+    codigos, ativos_unicos = pd.factorize(df['Ativo'], sort=False)
+    ordem = np.argsort(codigos, kind='stable')
+    codigos = codigos[ordem]
+    inicios = np.flatnonzero(np.append(True, codigos[1:] != codigos[:-1]))
+    fins = np.append(inicios[1:], len(codigos))
+
+    operacao = df['Operacao'].to_numpy()[ordem]
+    sentido = np.where(operacao == 'C', 1, np.where(operacao == 'V', -1, 0)).tolist()
+    quantidades = df['Quantidade'].to_numpy()[ordem].tolist()
+    valores = df['Valor'].to_numpy(dtype=float)[ordem].tolist()
+    datas = df['Data Pregao'].to_numpy()[ordem]
+
+    n = len(ordem)
+    corretoras = df['Corretora'].to_numpy()[ordem] if 'Corretora' in df.columns else np.full(n, 'N/A', dtype=object)
+    tipos = df['Tipo Mercado'].to_numpy()[ordem] if 'Tipo Mercado' in df.columns else np.full(n, 'N/A', dtype=object)
+    vencimentos = df['Vencimento'].to_numpy()[ordem]
+    # Linha de onde vêm os atributos: a primeira com corretora diferente de '' ou,
+    # se não houver, a última do ativo
+    posicoes = np.where(corretoras != '', np.arange(n), n)
+    origem = np.minimum.reduceat(posicoes, inicios)
+    origem = np.where(origem == n, fins - 1, origem)
+
+    for codigo, inicio, fim, linha in zip(codigos[inicios].tolist(), inicios.tolist(), fins.tolist(), origem.tolist()):
+        ativo = ativos_unicos[codigo]
+        atual = estado.get(ativo)
+        if atual is None:
+            atual = estado[ativo] = [0, 0.0, 0, 0.0, pd.NaT, '', '', '']
+        if atual[_CORRETORA] == '':
+            atual[_CORRETORA], atual[_TIPO_MERCADO], atual[_VENCIMENTO] = corretoras[linha], tipos[linha], vencimentos[linha]
+
+        qtd_long, custo_long, qtd_short, receita_short = atual[:4]
+        for i in range(inicio, fim):
+            op, qtd, valor = sentido[i], quantidades[i], valores[i]
+            if op == 1:
+                if qtd_short > 0:
+                    qtd_a_fechar = min(qtd, qtd_short)
+                    receita_media = receita_short / qtd_short
+                    qtd_short -= qtd_a_fechar
+                    receita_short -= receita_media * qtd_a_fechar
+                    qtd_restante = qtd - qtd_a_fechar
+                    if qtd_restante > 0:
+                        qtd_long += qtd_restante
+                        custo_long += (valor / qtd) * qtd_restante if qtd > 0 else 0
+                else:
+                    qtd_long += qtd
+                    custo_long += valor
+            elif op == -1:
+                if qtd_long > 0:
+                    qtd_a_vender = min(qtd, qtd_long)
+                    custo_medio = custo_long / qtd_long
+                    qtd_long -= qtd_a_vender
+                    custo_long -= custo_medio * qtd_a_vender
+                    qtd_restante = qtd - qtd_a_vender
+                    if qtd_restante > 0:
+                        qtd_short += qtd_restante
+                        receita_short += (valor / qtd) * qtd_restante if qtd > 0 else 0
+                else:
+                    qtd_short += qtd
+                    receita_short += valor
+        atual[:4] = [qtd_long, custo_long, qtd_short, receita_short]
+        atual[_ULTIMA_DATA] = datas[fim - 1]
+    return estado
+
+
+def _formatar_vencimentos(vencimentos) -> list:
+    """'dd/mm/aaaa' de cada vencimento (ou 'N/A'), convertendo cada valor distinto uma vez."""
+    codigos, unicos = pd.factorize(pd.Series(vencimentos, dtype=object), use_na_sentinel=False)
+    convertidos = []
+    for valor in unicos:
+        data = pd.to_datetime(valor, errors='coerce')
+        convertidos.append(data.strftime('%d/%m/%Y') if pd.notna(data) else 'N/A')
+    return [convertidos[c] for c in codigos]
+
+
+def _tabela_posicoes(estado: dict) -> pd.DataFrame:
+    """Ativos com posição comprada em aberto, ordenados por corretora, ativo e vencimento."""
+    abertos = [(ativo, dados) for ativo, dados in estado.items() if dados[_QTD_LONG] > 0.0001]
+    if not abertos:
+        return pd.DataFrame()
+    vencimentos = _formatar_vencimentos([dados[_VENCIMENTO] for _, dados in abertos])
+    linhas = []
+    for (ativo, dados), vencimento in zip(abertos, vencimentos):
+        qtd, custo, ultima = dados[_QTD_LONG], dados[_CUSTO_LONG], dados[_ULTIMA_DATA]
+        linhas.append({
+            'Corretora': dados[_CORRETORA], 'Ativo': ativo, 'Tipo Mercado': dados[_TIPO_MERCADO],
+            'Vencimento': vencimento, 'Quantidade Custódia': int(round(qtd)),
+            'Preço Médio Compra': round(custo / qtd, 4), 'Custo Total': round(custo, 2),
+            'Última Data Pregão': pd.Timestamp(ultima).strftime('%d/%m/%Y') if pd.notna(ultima) else 'N/A',
+        })
+    df_posicao = pd.DataFrame(linhas, columns=COLUNAS_POSICAO_FINAL)
+    return df_posicao.sort_values(by=['Corretora', 'Ativo', 'Vencimento'])
+
+
+def calcular_posicao(df_operacoes: pd.DataFrame) -> pd.DataFrame:
+    """Posição atual em custódia (colunas COLUNAS_POSICAO_FINAL) a partir de todas as operações."""
+    if df_operacoes.empty:
+        return pd.DataFrame()
+    return _tabela_posicoes(_percorrer_operacoes(_preparar_operacoes(df_operacoes)))
+
+
+# --- Posição em uma data (snapshots mensais) ---
+# O histórico guarda o estado de todos os ativos ao fim de cada mês com operações.
+# A posição em uma data parte do snapshot mais recente até ela e reaplica só as
+# operações posteriores, sem percorrer o histórico inteiro a cada consulta.
+
+_COLUNAS_HISTORICO = ['Data Pregao', 'Ativo', 'Operacao', 'Quantidade', 'Valor', 'Corretora', 'Tipo Mercado', 'Vencimento']
+
+
+def _copiar_estado(estado: dict) -> dict:
+    return {ativo: list(dados) for ativo, dados in estado.items()}
+
+
+def gerar_historico(df_operacoes: pd.DataFrame) -> dict:
+    """
+    Prepara as operações e gera os snapshots mensais da posição.
+    Retorna {'operacoes': operações preparadas em ordem cronológica,
+             'datas': datas das operações com data válida (datetime64, crescentes),
+             'snapshots': [(fim do mês, nº de operações aplicadas, estado)]}.
+    """
+    if df_operacoes.empty:
+        return {'operacoes': pd.DataFrame(columns=_COLUNAS_HISTORICO), 'datas': np.array([], dtype='datetime64[ns]'), 'snapshots': []}
+    df = _preparar_operacoes(df_operacoes)
+    df = df[[c for c in _COLUNAS_HISTORICO if c in df.columns]].reset_index(drop=True)
+    datas = df['Data Pregao'].dropna().to_numpy(dtype='datetime64[ns]')
+
+    snapshots = []
+    estado = {}
+    if len(datas):
+        meses = datas.astype('datetime64[M]')
+        # Início de cada mês nas operações ordenadas; o último limite fecha o último mês
+        limites = np.append(np.flatnonzero(np.append(True, meses[1:] != meses[:-1])), len(datas)).tolist()
+        for inicio, fim in zip(limites[:-1], limites[1:]):
+            estado = _percorrer_operacoes(df.iloc[inicio:fim], estado)
+            fim_do_mes = pd.Timestamp(meses[inicio]) + pd.offsets.MonthEnd(0)
+            snapshots.append((fim_do_mes, fim, _copiar_estado(estado)))
+    return {'operacoes': df, 'datas': datas, 'snapshots': snapshots}
+
+
+def posicao_em(historico: dict, data) -> pd.DataFrame:
+    """
+    Posição em custódia ao fim do dia 'data', considerando as operações com data de
+    pregão até ela (mesmas colunas de 'calcular_posicao').
+    """
+    data = pd.Timestamp(data).normalize()
+    snapshots = historico['snapshots']
+    # Snapshot mais recente com fim de mês até a data
+    indice = np.searchsorted([s[0] for s in snapshots], data, side='right') - 1
+    if indice >= 0:
+        _, inicio, estado = snapshots[indice]
+        estado = _copiar_estado(estado)
+    else:
+        inicio, estado = 0, {}
+    fim = int(np.searchsorted(historico['datas'], data.to_datetime64(), side='right'))
+    estado = _percorrer_operacoes(historico['operacoes'].iloc[inicio:fim], estado)
+    return _tabela_posicoes(estado)
+
+
+def posicao_atual(historico: dict) -> pd.DataFrame:
+    """
+    Posição com todas as operações do histórico, inclusive as sem data válida (o
+    mesmo que 'calcular_posicao' sobre as operações originais).
+    """
+    snapshots = historico['snapshots']
+    if snapshots:
+        _, inicio, estado = snapshots[-1]
+        estado = _copiar_estado(estado)
+    else:
+        inicio, estado = 0, {}
+    estado = _percorrer_operacoes(historico['operacoes'].iloc[inicio:], estado)
+    return _tabela_posicoes(estado)
@@ -0,0 +1,125 @@
+# relatorio_anual.py
+# Apuração anual do IR em lote, para várias contas (familiares, clientes) de uma vez.
+# Cada conta é um arquivo de operações no formato da coleção 'operacoes' (CSV ou
+# Parquet; o nome do arquivo é o nome da conta). As contas são apuradas em paralelo
+# e os resultados vão para dois arquivos Parquet:
+#   ir_mensal_<ano>.parquet  resumo mensal por categoria (o mesmo de 'calcular_ir')
+#                            de cada mês do ano, com a coluna 'Conta';
+#   ir_anual_<ano>.parquet   totais do ano por conta e categoria, com o prejuízo a
+#                            compensar e a DARF pendente em 31/12 (inclusive de
+#                            categorias sem operações no ano, que só carregam saldo).
+#
+#   python relatorio_anual.py --ano 2024 --saida relatorios/ contas/*.csv
+
+import argparse
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import ir_calculator
+from normalizacao_ativos import normalizar_operacoes
+from utils import converter_data_pregao
+
+COLUNAS_ANUAIS = ['Conta', 'Categoria', 'Vendas Totais', 'Lucro Bruto', 'IRRF', 'Lucro Líquido',
+                  'IR a Pagar', 'Prejuízo a Compensar', 'DARF Pendente']
+COLUNAS_TOTAIS = ['Vendas Totais', 'Lucro Bruto', 'IRRF', 'Lucro Líquido', 'IR a Pagar']
+COLUNAS_SALDOS = ['Conta', 'Categoria', 'Prejuízo Acumulado', 'DARF Acumulada']
+
+
+def apurar_conta(conta: str, df_operacoes: pd.DataFrame, ano: int):
+    """
+    IR da conta com as operações até 31/12 do ano e as opções expiradas até essa
+    data. O histórico anterior entra para a compensação de prejuízos.
+    Retorna (resumo mensal dos meses do ano, saldos de cada categoria em 31/12: o
+    estado do último mês apurado até essa data, mesmo que seja de um ano anterior).
+    """
+    fim_do_ano = pd.Timestamp(year=ano, month=12, day=31)
+    if df_operacoes.empty:
+        return pd.DataFrame(), pd.DataFrame(columns=COLUNAS_SALDOS)
+    datas = converter_data_pregao(df_operacoes['Data Pregao'])
+    # Os avisos de opções expiradas de cada conta não interessam no relatório
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_ir = ir_calculator.calcular_ir(df_operacoes[datas <= fim_do_ano], data_apuracao=fim_do_ano)
+    if df_ir.empty:
+        return df_ir, pd.DataFrame(columns=COLUNAS_SALDOS)
+    df_ir.insert(0, 'Conta', conta)
+    df_ir = df_ir[df_ir['Ano-Mês'] <= f"{ano}-12"]
+    saldos = (df_ir.sort_values('Ano-Mês', kind='stable')
+                   .groupby(['Conta', 'Categoria'], as_index=False, sort=True)
+                   [['Prejuízo Acumulado', 'DARF Acumulada']].last())
+    df_mensal = df_ir[df_ir['Ano-Mês'].str.startswith(f"{ano}-")].reset_index(drop=True)
+    return df_mensal, saldos[COLUNAS_SALDOS]
+
+
+def resumo_anual(df_mensal: pd.DataFrame, df_saldos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Totais do ano por conta e categoria, com o prejuízo a compensar e a DARF
+    pendente em 31/12 ('df_saldos', de 'apurar_conta'). Categorias sem eventos no
+    ano entram com totais zerados se tiverem saldo.
+    """
+    if df_mensal.empty:
+        anual = pd.DataFrame(columns=['Conta', 'Categoria'] + COLUNAS_TOTAIS)
+    else:
+        anual = df_mensal.groupby(['Conta', 'Categoria'], as_index=False, sort=True)[COLUNAS_TOTAIS].sum()
+    saldos = df_saldos[(df_saldos['Prejuízo Acumulado'] != 0) | (df_saldos['DARF Acumulada'] != 0)]
+    anual = anual.merge(saldos, on=['Conta', 'Categoria'], how='outer', sort=True)
+    anual[COLUNAS_TOTAIS] = anual[COLUNAS_TOTAIS].fillna(0.0)
+    anual['Prejuízo a Compensar'] = -anual['Prejuízo Acumulado'].fillna(0.0)
+    anual['DARF Pendente'] = anual['DARF Acumulada'].fillna(0.0)
+    return anual[COLUNAS_ANUAIS]
+
+
+def _apurar_arquivo(caminho: str, ano: int):
+    conta = os.path.splitext(os.path.basename(caminho))[0]
+    return apurar_conta(conta, ler_operacoes(caminho), ano)
+
+
+def ler_operacoes(caminho: str) -> pd.DataFrame:
+    """Operações de uma conta a partir de CSV (exportado do app) ou Parquet, com os ativos padronizados."""
+    if caminho.lower().endswith('.parquet'):
+        df = pd.read_parquet(caminho)
+    else:
+        df = pd.read_csv(caminho, dtype={'Vencimento': str, 'Titulo': str})
+    datas = df['Data Pregao']
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        # 'dd/mm/aaaa' como gravado pela ingestão ou ISO, quando exportado já tipado
+        convertidas = pd.to_datetime(datas, format='%d/%m/%Y', errors='coerce')
+        df['Data Pregao'] = convertidas.fillna(pd.to_datetime(datas, format='ISO8601', errors='coerce'))
+    # Nomes de ativo como na leitura do banco (ativo_mapeamento.csv)
+    return normalizar_operacoes(df)
+
+
+def gerar_relatorios(arquivos: list, ano: int, processos: int = None):
+    """Apura as contas em paralelo (um processo por conta). Retorna (mensal, anual)."""
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        resultados = list(executor.map(_apurar_arquivo, arquivos, [ano] * len(arquivos)))
+    mensais = [mensal for mensal, _ in resultados if not mensal.empty]
+    saldos = [s for _, s in resultados if not s.empty]
+    df_mensal = pd.concat(mensais, ignore_index=True) if mensais else pd.DataFrame()
+    df_saldos = pd.concat(saldos, ignore_index=True) if saldos else pd.DataFrame(columns=COLUNAS_SALDOS)
+    return df_mensal, resumo_anual(df_mensal, df_saldos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apuração anual do IR em lote")
+    parser.add_argument("arquivos", nargs="+", help="operações de cada conta (.csv ou .parquet)")
+    parser.add_argument("--ano", type=int, required=True)
+    parser.add_argument("--saida", default=".", help="diretório dos arquivos Parquet")
+    parser.add_argument("--processos", type=int, default=None, help="padrão: um por núcleo")
+    args = parser.parse_args()
+
+    df_mensal, df_anual = gerar_relatorios(args.arquivos, args.ano, args.processos)
+    os.makedirs(args.saida, exist_ok=True)
+    caminho_mensal = os.path.join(args.saida, f"ir_mensal_{args.ano}.parquet")
+    caminho_anual = os.path.join(args.saida, f"ir_anual_{args.ano}.parquet")
+    df_mensal.to_parquet(caminho_mensal, index=False)
+    df_anual.to_parquet(caminho_anual, index=False)
+    print(f"{len(args.arquivos)} conta(s) apurada(s): {len(df_mensal)} linha(s) mensais em "
+          f"'{caminho_mensal}', {len(df_anual)} linha(s) anuais em '{caminho_anual}'.")
+
+
+if __name__ == "__main__":
+    main()
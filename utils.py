@@ -32,6 +32,15 @@ def parse_br_float(num_str: str) -> float:
         # retorna 0.0 para evitar que o programa quebre.
         return 0.0
 
+def converter_data_pregao(serie: pd.Series) -> pd.Series:
+    """
+    Retorna a coluna 'Data Pregao' como datetime. Os dados vindos do banco já chegam
+    tipados e são devolvidos sem reprocessamento; texto 'dd/mm/aaaa' é convertido.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return pd.to_datetime(serie, format='%d/%m/%Y', errors='coerce')
+
 def carregar_dados_corretoras(filename="corretoras_cnpj.csv"):
     """
     Carrega os dados das corretoras a partir de um arquivo CSV de forma robusta,